@@ -1,20 +1,139 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-# The file will be created in the data folder
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data/quanta.db"
+from app.core import config
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False} # Needed for SQLite
-)
+def _apply_sqlite_pragmas(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+def _use_sqlite_begin(engine, mode):
+    # pysqlite starts transactions itself (always DEFERRED); take over so BEGIN carries our mode
+    @event.listens_for(engine, "connect")
+    def _no_implicit_begin(dbapi_conn, connection_record):
+        dbapi_conn.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _begin(conn):
+        conn.exec_driver_sql(f"BEGIN {mode}")
+
+def build_engine(url=None, tune_sqlite=True, sqlite_begin=None):
+    """
+    Engine for `url` (default: config.DATABASE_URL) with the configured pool.
+    SQLite connections get the PRAGMAs from config on connect (WAL, so readers
+    don't block the writer, plus a busy timeout instead of instant
+    "database is locked") and begin transactions as config.SQLITE_BEGIN.
+    Server databases get pre-ping and recycling.
+    """
+    url = make_url(url or config.DATABASE_URL)
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            # One shared in-memory database: no pool sizing applies
+            return create_engine(url, connect_args={"check_same_thread": False})
+        if url.database and os.path.dirname(url.database):
+            os.makedirs(os.path.dirname(url.database), exist_ok=True)
+        engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000}, # Needed for SQLite
+            pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW, pool_timeout=config.DB_POOL_TIMEOUT,
+        )
+        if tune_sqlite:
+            event.listen(engine, "connect", _apply_sqlite_pragmas)
+            mode = (sqlite_begin or config.SQLITE_BEGIN).upper()
+            if mode != "DEFERRED": _use_sqlite_begin(engine, mode)
+        return engine
+
+    return create_engine(
+        url,
+        pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW, pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE, pool_pre_ping=True,
+    )
+
+# Blocking drivers and their asyncio counterparts
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg", "mysql": "mysql+aiomysql"}
+
+def async_url(url=None):
+    """The asyncio flavour of `url` (config.ASYNC_DATABASE_URL wins when set)."""
+    if url is None and config.ASYNC_DATABASE_URL: return make_url(config.ASYNC_DATABASE_URL)
+    url = make_url(url or config.DATABASE_URL)
+    if url.get_dialect().is_async: return url
+    backend = url.get_backend_name()
+    if backend == "postgresql" and url.get_driver_name() == "psycopg": return url # psycopg 3 does both
+    return url.set(drivername=ASYNC_DRIVERS.get(backend, url.drivername))
+
+def build_async_engine(url=None, tune_sqlite=True, sqlite_begin=None):
+    """
+    AsyncEngine on the same database as build_engine(url), with the same pool
+    settings, PRAGMAs and BEGIN mode (events go on its sync_engine).
+    """
+    url = async_url(url)
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return create_async_engine(url)
+        if url.database and os.path.dirname(url.database):
+            os.makedirs(os.path.dirname(url.database), exist_ok=True)
+        engine = create_async_engine(
+            url,
+            connect_args={"timeout": config.SQLITE_BUSY_TIMEOUT_MS / 1000},
+            poolclass=AsyncAdaptedQueuePool, # aiosqlite defaults to NullPool: a new connection (and PRAGMAs) per checkout
+            pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW, pool_timeout=config.DB_POOL_TIMEOUT,
+        )
+        if tune_sqlite:
+            event.listen(engine.sync_engine, "connect", _apply_sqlite_pragmas)
+            mode = (sqlite_begin or config.SQLITE_BEGIN).upper()
+            if mode != "DEFERRED": _use_sqlite_begin(engine.sync_engine, mode)
+        return engine
+
+    return create_async_engine(
+        url,
+        pool_size=config.DB_POOL_SIZE, max_overflow=config.DB_MAX_OVERFLOW, pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE, pool_pre_ping=True,
+    )
+
+# Blocking sessions: startup, threadpool routes, AI pool callbacks
+engine = build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# asyncio sessions for `async def` routes. Objects stay usable after commit,
+# since an expired attribute can't lazy-load outside an await
+async_engine = build_async_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
-# Dependency to use in routes
-def get_db():
+def add_missing_columns(bind, metadata):
+    """
+    create_all() never alters existing tables, so columns added to a model
+    after the table was created are appended here (nullable, no backfill).
+    """
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name): continue
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing: continue
+                col_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+# Dependencies to use in routes
+async def get_db():
+    """AsyncSession for `async def` routes."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_sync_db():
+    """Blocking Session for plain `def` routes (FastAPI runs those in its threadpool)."""
     db = SessionLocal()
     try:
         yield db
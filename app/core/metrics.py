@@ -0,0 +1,111 @@
+import contextvars
+import time
+
+from sqlalchemy import event
+from prometheus_client import CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# One registry for the app (not the library's global one, which also carries
+# process/platform collectors we don't need). Per process: with several
+# uvicorn workers, each scrape sees the worker that answered it.
+registry = CollectorRegistry()
+
+# --- REQUESTS ---
+REQUEST_SECONDS = Histogram(
+    "quanta_request_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], registry=registry,
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    "quanta_request_db_queries", "SQL statements executed while serving one request",
+    ["route"], registry=registry,
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+
+# --- ENGINE ---
+REPLAY_SECONDS = Histogram(
+    "quanta_replay_seconds", "Time to rebuild a match state on a cache miss (checkpoint restore + replay)",
+    registry=registry, buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1),
+)
+REPLAY_PLIES = Histogram(
+    "quanta_replay_plies", "Moves replayed per cache miss (the tail after the checkpoint)",
+    registry=registry, buckets=(0, 1, 5, 10, 25, 50, 100, 200, 500, 1000),
+)
+AI_THINK_SECONDS = Histogram(
+    "quanta_ai_think_seconds", "QuantumAI.calculate_move time by difficulty",
+    ["difficulty"], registry=registry, buckets=(.001, .005, .01, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+AI_CANDIDATES = Histogram(
+    "quanta_ai_candidates", "Candidate moves generated per AI turn",
+    ["difficulty"], registry=registry, buckets=(0, 5, 10, 20, 30, 40, 60, 80, 120),
+)
+FRAGMENTS_REMOVED = Counter(
+    "quanta_fragments_removed", "Piece fragments removed by the compaction after each played move",
+    ["kind"], registry=registry,  # coalesced: folded into a same-piece fragment; dropped: below the epsilon
+)
+
+
+def observe_ai(stats):
+    """Records one AI turn from QuantumAI.last_stats (inline, or shipped back by a pool worker)."""
+    if not stats: return
+    difficulty = stats.get("difficulty", "normal")
+    if stats.get("elapsed") is not None: AI_THINK_SECONDS.labels(difficulty).observe(stats["elapsed"])
+    if stats.get("candidates") is not None: AI_CANDIDATES.labels(difficulty).observe(stats["candidates"])
+
+def observe_compaction(undo):
+    """Records what compaction removed after a played move (the UndoRecord apply_move returned)."""
+    if undo.coalesced: FRAGMENTS_REMOVED.labels("coalesced").inc(undo.coalesced)
+    if undo.dropped: FRAGMENTS_REMOVED.labels("dropped").inc(undo.dropped)
+
+
+# --- DB QUERIES PER REQUEST ---
+# The middleware puts a fresh one-item list in the context; threadpool routes
+# and tasks run on copies of the context, so they share the list, not a value.
+_query_count = contextvars.ContextVar("quanta_query_count", default=None)
+
+def _count_query(*args):
+    counter = _query_count.get()
+    if counter is not None: counter[0] += 1
+
+def count_queries(*engines):
+    """Counts statements run on these (sync) engines towards the current request."""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _count_query)
+
+def start_request():
+    counter = [0]
+    _query_count.set(counter)
+    return counter, time.perf_counter()
+
+def finish_request(request, status, counter, started):
+    route = request.scope.get("route")
+    route = route.path if route is not None else "unmatched"  # Templates, not raw paths: bounded label set
+    REQUEST_SECONDS.labels(request.method, route, str(status)).observe(time.perf_counter() - started)
+    REQUEST_QUERIES.labels(route).observe(counter[0])
+
+
+# --- SNAPSHOT GAUGES ---
+class StatsCollector:
+    """
+    Reads the in-process stats() dicts at scrape time, so the hot paths pay
+    nothing for these. `sources` maps a prefix to a zero-argument callable;
+    `counters` names the keys that only ever grow.
+    """
+
+    def __init__(self, sources, counters=()):
+        self.sources = sources
+        self.counters = set(counters)
+
+    def collect(self):
+        for prefix, read in self.sources.items():
+            for key, value in read().items():
+                if not isinstance(value, (int, float)): continue
+                name = f"quanta_{prefix}_{key}"
+                if key in self.counters:
+                    yield CounterMetricFamily(name, f"{prefix} {key}", value=value)
+                else:
+                    yield GaugeMetricFamily(name, f"{prefix} {key}", value=value)
+
+
+def render():
+    return generate_latest(registry), CONTENT_TYPE_LATEST
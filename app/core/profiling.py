@@ -0,0 +1,203 @@
+import collections
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+
+from app.core import config
+
+HEADER = "X-Quanta-Profile"
+
+# The profile of the request being served, if any (threadpool routes see it too:
+# they run on a copy of the request's context)
+_current = contextvars.ContextVar("quanta_profile", default=None)
+
+
+def enabled():
+    return bool(config.PROFILE_TOKEN or config.PROFILE_SAMPLE_RATE > 0 or config.PROFILE_SLOW_MS > 0)
+
+
+class Profile:
+    """
+    Stack samples and SQL statements of one request. Samples are kept folded
+    ("outer;inner" -> count), so memory grows with the distinct stacks, not
+    with the request's duration.
+    """
+
+    def __init__(self, request, reason):
+        self.method = request.method
+        self.path = request.url.path
+        self.reason = reason  # "header", "sampled", or None while we don't know yet (slow threshold)
+        self.started = time.time()
+        self.threads = {threading.get_ident()}  # The event loop; threadpool threads join on their first statement
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.queries = []  # (statement, seconds, thread name)
+
+    def add_query(self, statement, seconds):
+        self.threads.add(threading.get_ident())
+        self.queries.append((statement, seconds, threading.current_thread().name))
+
+    def statements(self):
+        """Queries grouped by statement text, slowest total first: an N+1 shows up as one line with a high count."""
+        grouped = {}
+        for statement, seconds, _ in self.queries:
+            count, total = grouped.get(statement, (0, 0.0))
+            grouped[statement] = (count + 1, total + seconds)
+        return sorted(({"statement": s, "count": c, "seconds": t} for s, (c, t) in grouped.items()), key=lambda g: -g["seconds"])
+
+    def save(self, directory, route, status, elapsed):
+        """Writes <name>.folded (collapsed stacks, for flamegraph.pl / speedscope) and <name>.json. Returns <name>."""
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        name = (f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))}-{int(self.started * 1000) % 1000:03d}"
+                f"-{os.getpid()}-{self.method.lower()}-{slug}-{elapsed * 1000:.0f}ms")
+        base = os.path.join(directory, name)
+        with open(base + ".folded", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(base + ".json", "w") as f:
+            json.dump({
+                "method": self.method, "path": self.path, "route": route, "status": status,
+                "reason": self.reason, "elapsed": elapsed, "interval": config.PROFILE_INTERVAL, "samples": self.samples,
+                "query_count": len(self.queries), "query_seconds": sum(q[1] for q in self.queries),
+                "statements": self.statements(),
+                "queries": [{"statement": s, "seconds": t, "thread": th} for s, t, th in self.queries],
+            }, f, indent=1)
+        return name
+
+
+# --- SAMPLER ---
+class Sampler:
+    """
+    One daemon thread that, while any profile is recording, wakes every
+    `interval` seconds and folds the current stack of each thread those
+    profiles follow. It stops by itself when the last profile finishes.
+
+    The event loop thread is shared by every coroutine, so an async route's
+    profile also shows whatever else the loop ran meanwhile (each stack is
+    rooted at its thread name to tell the threads apart).
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._labels = {}  # code object -> frame label
+
+    def add(self, profile):
+        with self._lock:
+            self._active.add(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile):
+        with self._lock:
+            self._active.discard(profile)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            if path.startswith(os.getcwd() + os.sep): path = os.path.relpath(path)
+            else: path = os.sep.join(path.split(os.sep)[-2:])  # site-packages/stdlib: package/module.py is enough
+            label = self._labels[code] = f"{code.co_name} ({path}:{code.co_firstlineno})"
+        return label
+
+    def _fold(self, thread_name, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.append(thread_name)
+        return ";".join(reversed(labels))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active)
+                if not active:
+                    self._thread = None
+                    return
+            frames = sys._current_frames()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            folded = {}  # Several profiles may follow the same thread (the event loop): fold it once per tick
+            for profile in active:
+                for ident in list(profile.threads):
+                    if ident not in folded:
+                        frame = frames.get(ident)
+                        folded[ident] = self._fold(names.get(ident, str(ident)), frame) if frame is not None else None
+                    if folded[ident] is not None:
+                        profile.stacks[folded[ident]] += 1
+                        profile.samples += 1
+            del frames, folded
+
+
+sampler = Sampler(config.PROFILE_INTERVAL)
+
+
+# --- SQL TRACE ---
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None: context._quanta_profile_started = time.perf_counter()
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, "_quanta_profile_started", None)
+    if profile is not None and started is not None:
+        profile.add_query(statement, time.perf_counter() - started)  # Statement text only: parameters may be password hashes
+
+def trace_queries(*engines):
+    """Records every statement run on these (sync) engines, with its duration, into the current request's profile."""
+    if not enabled(): return
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_execute)
+        event.listen(engine, "after_cursor_execute", _after_execute)
+
+
+# --- REQUESTS ---
+def start_request(request):
+    """The request's Profile, now recording, or None if it isn't selected (and no slow threshold applies)."""
+    if not enabled(): return None
+    reason = None
+    if config.PROFILE_TOKEN and request.headers.get(HEADER) == config.PROFILE_TOKEN: reason = "header"
+    elif config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE: reason = "sampled"
+    elif config.PROFILE_SLOW_MS <= 0: return None
+    profile = Profile(request, reason)
+    _current.set(profile)
+    sampler.add(profile)
+    return profile
+
+def finish_request(profile, request, status, elapsed):
+    """Stops recording; returns the saved profile's name, or None if the request was not slow enough to keep."""
+    sampler.remove(profile)
+    _current.set(None)
+    if profile.reason is None:
+        if elapsed * 1000 < config.PROFILE_SLOW_MS: return None
+        profile.reason = "slow"
+    route = request.scope.get("route")
+    route = route.path if route is not None else "unmatched"
+    name = profile.save(config.PROFILE_DIR, route, status, elapsed)
+    rotate(config.PROFILE_DIR, config.PROFILE_KEEP)
+    return name
+
+def rotate(directory, keep):
+    """Deletes all but the `keep` newest profiles (names start with their timestamp)."""
+    try:
+        names = sorted({f.rsplit(".", 1)[0] for f in os.listdir(directory) if f.endswith((".folded", ".json"))})
+    except FileNotFoundError:
+        return
+    for name in names[:max(0, len(names) - keep)]:
+        for ext in (".folded", ".json"):
+            try:
+                os.remove(os.path.join(directory, name + ext))
+            except FileNotFoundError:
+                pass  # Another worker rotated it first
@@ -1,6 +1,10 @@
+import asyncio
 import bcrypt
 import hashlib
 import base64
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import config
 
 def _pre_hash(password: str) -> bytes:
     """
@@ -26,13 +30,49 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     safe_password = _pre_hash(plain_password)
     
     # Check
-    return bcrypt.checkpw(safe_password, hashed_bytes)
+    try:
+        return bcrypt.checkpw(safe_password, hashed_bytes)
+    except ValueError:
+        return False # Not a bcrypt hash (e.g. the CPU_AI/Guest placeholder)
 
-def get_password_hash(password: str) -> str:
+def get_password_hash(password: str, rounds=None) -> str:
     """Converts a plain password into a secure bcrypt hash."""
     # 1. Compress length
     safe_password = _pre_hash(password)
     # 2. Generate Salt and Hash
-    hashed = bcrypt.hashpw(safe_password, bcrypt.gensalt())
+    hashed = bcrypt.hashpw(safe_password, bcrypt.gensalt(rounds or config.BCRYPT_ROUNDS))
     # 3. Return as string for database storage
     return hashed.decode('utf-8')
+
+def hash_rounds(hashed_password: str):
+    """Work factor a stored hash was made with ("$2b$12$..." -> 12), None if it isn't bcrypt."""
+    parts = hashed_password.split('$') if hashed_password else []
+    if len(parts) < 4 or not parts[2].isdigit(): return None
+    return int(parts[2])
+
+def needs_rehash(hashed_password: str) -> bool:
+    return hash_rounds(hashed_password) != config.BCRYPT_ROUNDS
+
+# --- OFF THE EVENT LOOP ---
+# bcrypt releases the GIL, so a few threads hash in parallel while the loop keeps serving
+_hash_pool = None
+
+async def _run(fn, *args):
+    global _hash_pool
+    if not config.HASH_WORKERS:
+        return fn(*args)
+    if _hash_pool is None:
+        _hash_pool = ThreadPoolExecutor(max_workers=config.HASH_WORKERS, thread_name_prefix="bcrypt")
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, fn, *args)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    return await _run(get_password_hash, password)
+
+def shutdown():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False)
+        _hash_pool = None
@@ -1,15 +1,25 @@
-from fastapi import FastAPI, Request
+import time
+
+from fastapi import FastAPI, Request, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware 
 
-from app.core import database
+from starlette.concurrency import run_in_threadpool
+
+from app.core import config, database, metrics, profiling, security
 from app.modules.auth import router as auth_router, models as auth_models
-from app.modules.tournament import router as tournament_router, models as tourney_models
+from app.modules.tournament import router as tournament_router, models as tourney_models, moves as tourney_moves
+from app.modules.tournament.workers import ai_pool
+from app.modules.tournament.clocks import clock_sweeper
+from app.modules.tournament.cache import match_cache
+from app.modules.tournament.live import live_hub
 
 # Init DB Tables
 auth_models.Base.metadata.create_all(bind=database.engine)
 tourney_models.Base.metadata.create_all(bind=database.engine)
+database.add_missing_columns(database.engine, database.Base.metadata)
+tourney_moves.migrate_board_state(database.engine) # board_state text -> match_moves rows
 
 app = FastAPI()
 
@@ -29,6 +39,40 @@ async def auth_middleware(request: Request, call_next):
     response = await call_next(request)
     return response
 
+# --- 1b. METRICS (latency and SQL statements per route, see /metrics) ---
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    counter, started = metrics.start_request()
+    response = await call_next(request)
+    metrics.finish_request(request, response.status_code, counter, started)
+    return response
+
+metrics.count_queries(database.engine, database.async_engine.sync_engine)
+
+def match_counts():
+    with database.SessionLocal() as db:
+        return {"active": db.query(tourney_models.TournamentMatch).filter(tourney_models.TournamentMatch.is_active == True).count()}
+
+metrics.registry.register(metrics.StatsCollector(
+    {"matches": match_counts, "ai_pool": ai_pool.stats, "match_cache": match_cache.stats,
+     "live": live_hub.stats, "clocks": clock_sweeper.stats},
+    counters=("submitted", "completed", "rejected", "failed", "hits", "misses", "evictions",
+              "published", "dropped", "sweeps", "timeouts"),
+))
+
+# --- 1c. PROFILING (opt-in stack samples + SQL trace per request, see config PROFILING) ---
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    profile = profiling.start_request(request)
+    if profile is None: return await call_next(request)
+    started = time.perf_counter()
+    response = await call_next(request)
+    name = await run_in_threadpool(profiling.finish_request, profile, request, response.status_code, time.perf_counter() - started)
+    if name: response.headers[profiling.HEADER] = name
+    return response
+
+profiling.trace_queries(database.engine, database.async_engine.sync_engine)
+
 # --- 2. ADD SESSION MIDDLEWARE LAST ---
 app.add_middleware(SessionMiddleware, secret_key="SUPER_SECRET_QUANTUM_KEY_CHANGE_THIS")
 
@@ -36,7 +80,32 @@ app.add_middleware(SessionMiddleware, secret_key="SUPER_SECRET_QUANTUM_KEY_CHANG
 app.include_router(auth_router.router, prefix="/auth", tags=["auth"])
 app.include_router(tournament_router.router, prefix="/tournament", tags=["tournament"])
 
+@app.on_event("startup")
+def start_clock_sweeper():
+    if config.CLOCK_SWEEPER: clock_sweeper.start()
+
+@app.on_event("shutdown")
+def stop_clock_sweeper():
+    clock_sweeper.stop()
+
+@app.on_event("shutdown")
+def stop_ai_workers():
+    ai_pool.shutdown()
+
+@app.on_event("shutdown")
+def stop_hash_workers():
+    security.shutdown()
+
+@app.on_event("shutdown")
+async def close_async_db():
+    await database.async_engine.dispose() # aiosqlite connections each hold a thread
+
 # --- 4. ROUTES ---
+@app.get("/metrics")
+def metrics_endpoint():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
+
 @app.get("/")
 def home(request: Request):
     return templates.TemplateResponse("club/index.html", {"request": request})
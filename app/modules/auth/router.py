@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, Request, Form, status
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core import database, security
 from app.modules.auth import models, schemas
 
@@ -25,7 +26,7 @@ async def register(
     username: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
     # 1. Validate Input (Pydantic)
     try:
@@ -34,15 +35,15 @@ async def register(
         return templates.TemplateResponse("auth/register.html", {"request": request, "error": "Invalid Data format."})
 
     # 2. Check Exists (SQLAlchemy prevents SQL Injection)
-    existing_user = db.query(models.User).filter(
+    existing_user = await db.scalar(select(models.User).where(
         (models.User.username == user_data.username) | (models.User.email == user_data.email)
-    ).first()
+    ).limit(1))
     
     if existing_user:
         return templates.TemplateResponse("auth/register.html", {"request": request, "error": "Username or Email already taken."})
 
     # 3. Hash Password & Save
-    hashed_pwd = security.get_password_hash(user_data.password)
+    hashed_pwd = await security.get_password_hash_async(user_data.password)
     new_user = models.User(
         username=user_data.username,
         email=user_data.email,
@@ -50,8 +51,7 @@ async def register(
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
 
     return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
 
@@ -60,15 +60,20 @@ async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(database.get_db)
+    db: AsyncSession = Depends(database.get_db)
 ):
     # 1. Find User
-    user = db.query(models.User).filter(models.User.username == username).first()
+    user = await db.scalar(select(models.User).where(models.User.username == username).limit(1))
     
     # 2. Verify Password (Secure Compare)
-    if not user or not security.verify_password(password, user.hashed_password):
+    if not user or not await security.verify_password_async(password, user.hashed_password):
         return templates.TemplateResponse("auth/login.html", {"request": request, "error": "Invalid Credentials"})
 
+    # Stored with another work factor (BCRYPT_ROUNDS changed): upgrade it now we know the password
+    if security.needs_rehash(user.hashed_password):
+        user.hashed_password = await security.get_password_hash_async(password)
+        await db.commit()
+
     # 3. Create Session (Server-Side Signed Cookie)
     request.session['user_id'] = user.id
     request.session['username'] = user.username
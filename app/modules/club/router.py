@@ -27,7 +27,7 @@ def seed_club_data(db: Session):
         db.commit()
 
 @router.get("/about")
-def about_page(request: Request, db: Session = Depends(database.get_db)):
+def about_page(request: Request, db: Session = Depends(database.get_sync_db)):
     # 1. Seed data if empty (For your MVP convenience)
     seed_club_data(db)
     
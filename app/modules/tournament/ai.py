@@ -1,16 +1,32 @@
 import random
 import time
-# No json needed anymore for cloning
-from app.modules.tournament.engine import QuantumState
+from app.core import config
+from app.modules.tournament.engine import QuantumState, SQUARE_INDEX, ZOBRIST_BLACK_TO_MOVE
+from app.modules.tournament.transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+WIN_SCORE = 100000
+INF = float('inf')
+
+class SearchBudgetExceeded(Exception):
+    """Raised inside the search when the time or node budget runs out."""
 
 class QuantumAI:
-    def __init__(self):
+    def __init__(self, time_budget=None, node_budget=None, max_depth=None, tt=None):
         self.cols = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
         self.piece_values = {'p': 10, 'n': 30, 'b': 30, 'r': 50, 'q': 90, 'k': 900}
+        self.time_budget = config.AI_TIME_BUDGET if time_budget is None else time_budget
+        self.node_budget = config.AI_NODE_BUDGET if node_budget is None else node_budget
+        self.max_depth = config.AI_MAX_DEPTH if max_depth is None else max_depth
+        # Pass a shared table to keep results across moves (e.g. one per worker process)
+        self.tt = tt if tt is not None else TranspositionTable(config.AI_TT_SIZE)
+        self.last_stats = {}
 
     def get_color(self, char):
         return 'white' if char.isupper() else 'black'
 
+    def other(self, color):
+        return 'black' if color == 'white' else 'white'
+
     def evaluate_board(self, frontend_data, ai_color):
         score = 0
         for data in frontend_data.values():
@@ -23,12 +39,17 @@ class QuantumAI:
         return score
 
     def calculate_move(self, engine: QuantumState, ai_color='black', difficulty='normal'):
-        time.sleep(0.5)
-        
+        """
+        Returns candidate moves, best first. The caller plays the first one the
+        engine accepts (a capture can still fail its measurement).
+        """
+        start = time.perf_counter()
+        self.last_stats = {'difficulty': difficulty, 'nodes': 0, 'depth': 0}
+
         candidates = []
         board_simple = engine.get_simple_board()
         my_pieces = [sq for sq, p in board_simple.items() if self.get_color(p) == ai_color]
-        
+
         for src in my_pieces:
             p_type = board_simple[src]
             valid_targets = engine._get_valid_targets(src, p_type)
@@ -40,28 +61,200 @@ class QuantumAI:
                         candidates.append(f"{src}{tgt}^{src}{t2}")
 
         random.shuffle(candidates)
+        self.last_stats['candidates'] = len(candidates)
         if not candidates: return []
 
-        if difficulty == 'easy': return candidates
+        if difficulty == 'easy':
+            self.last_stats['elapsed'] = time.perf_counter() - start
+            return candidates
 
         if difficulty == 'normal':
             captures = [m for m in candidates if m[2:] in board_simple]
+            self.last_stats['elapsed'] = time.perf_counter() - start
             return captures + candidates
 
-        # HARD MODE
-        best_moves = []
-        best_score = -99999
-        
-        for move in candidates[:15]:
-            # CRITICAL FIX: Use clone() instead of JSON
-            test = engine.clone()
-            
-            if test.apply_move(move):
-                score = self.evaluate_board(test.get_frontend_board(), ai_color)
-                if score > best_score:
-                    best_score = score
-                    best_moves = [move]
-                elif score == best_score:
-                    best_moves.append(move)
-        
-        return best_moves if best_moves else candidates
+        # HARD MODE: iterative deepening search until the budget runs out
+        ranked = self.search(engine, candidates, ai_color)
+        self.last_stats['elapsed'] = time.perf_counter() - start
+        return ranked
+
+    # --- SEARCH ---
+    def search(self, engine, root_moves, color):
+        """
+        Iterative-deepening negamax with alpha-beta pruning. Probabilistic captures
+        are chance nodes: the capture lands with the target's probability; a miss
+        leaves the board as it was and the side to move tries its next move (see
+        _retry_values). Returns `root_moves` ordered by their score at the deepest
+        completed iteration.
+        """
+        self.nodes = 0
+        self.tt.new_search()
+        probes, hits = self.tt.probes, self.tt.hits
+        self.deadline = time.perf_counter() + self.time_budget if self.time_budget else None
+        start = time.perf_counter()
+        ranked = list(root_moves)
+        scores = {}
+        depth_reached = 0
+
+        for depth in range(1, self.max_depth + 1):
+            try:
+                iteration = {}
+                chances = []
+                alpha = -INF
+                for move in ranked:
+                    scored = self._score_move(engine, move, color, depth, alpha, INF)
+                    if scored is None: continue # Illegal (e.g. a split onto a blocked square)
+                    score, prob = scored
+                    if prob < 1.0:
+                        chances.append((score, prob, move))
+                        continue
+                    iteration[move] = score
+                    alpha = max(alpha, score)
+                if chances:
+                    fallback = alpha if alpha != -INF else self.evaluate_state(engine, color)
+                    iteration.update(self._retry_values(chances, fallback))
+            except SearchBudgetExceeded:
+                break
+            scores = iteration
+            depth_reached = depth
+            # Best-first ordering doubles as move ordering for the next iteration
+            ranked.sort(key=lambda m: scores.get(m, -INF), reverse=True)
+
+        elapsed = time.perf_counter() - start
+        self.last_stats.update({
+            'nodes': self.nodes,
+            'depth': depth_reached,
+            'search_time': elapsed,
+            'nps': int(self.nodes / elapsed) if elapsed > 0 else 0,
+            'best_score': scores.get(ranked[0]) if ranked else None,
+            'tt_hit_rate': (self.tt.hits - hits) / (self.tt.probes - probes) if self.tt.probes > probes else 0.0,
+            'tt_filled': self.tt.filled,
+            'tt_memory_bytes': self.tt.memory_bytes(),
+        })
+        return ranked
+
+    def _tick(self):
+        self.nodes += 1
+        if self.node_budget and self.nodes > self.node_budget:
+            raise SearchBudgetExceeded()
+        if self.deadline and self.nodes % 64 == 0 and time.perf_counter() > self.deadline:
+            raise SearchBudgetExceeded()
+
+    def _score_move(self, engine, move, color, depth, alpha, beta):
+        """
+        (negamax value of `move` for `color`, probability it lands), or None if
+        the engine rejects it. The probability is below 1 only for a capture that
+        can miss; its value is then the one if it lands, searched without bounds
+        (they don't carry through the expectation, see _retry_values).
+        """
+        tgt = move[2:] if '^' not in move else None
+        target_prob = self._capture_probability(engine, tgt, color) if tgt else None
+
+        undo = engine.apply_move(move, collapse=True)
+        if not undo: return None
+        try:
+            if target_prob is None or target_prob >= 1.0:
+                return -self._negamax(engine, self.other(color), depth - 1, -beta, -alpha), 1.0
+            return -self._negamax(engine, self.other(color), depth - 1, -INF, INF), target_prob
+        finally:
+            engine.undo_move(undo)
+
+    @staticmethod
+    def _retry_values(chances, fallback):
+        """
+        Values of the captures that can miss, `chances` = [(landed, prob, move)].
+        A miss changes nothing and the side to move tries its next move, so the
+        best plan tries the captures landing better than what is left, best
+        landing first, and ends with the best sure move (`fallback`). Every
+        capture is valued as tried just before the part of the plan landing worse
+        than it: prob * landed + (1 - prob) * (that part).
+        """
+        values = {}
+        rest = fallback
+        for landed, prob, move in sorted(chances, key=lambda c: c[0]):
+            values[move] = prob * landed + (1 - prob) * rest
+            if landed > rest: rest = values[move]
+        return values
+
+    def _negamax(self, engine, color, depth, alpha, beta):
+        self._tick()
+        status = engine.check_game_over()
+        if status['game_over']:
+            return WIN_SCORE + depth if status['winner'] == color else -WIN_SCORE - depth
+        if depth == 0:
+            return self.evaluate_state(engine, color)
+
+        key = engine.zobrist ^ (ZOBRIST_BLACK_TO_MOVE if color == 'black' else 0)
+        entry = self.tt.probe(key)
+        hash_move = None
+        if entry is not None:
+            _, e_depth, e_score, e_flag, hash_move, _ = entry
+            if e_depth >= depth:
+                if e_flag == EXACT: return e_score
+                if e_flag == LOWER and e_score > alpha: alpha = e_score
+                elif e_flag == UPPER and e_score < beta: beta = e_score
+                if alpha >= beta: return e_score
+
+        alpha_orig = alpha
+        best = -INF
+        best_move = None
+        moves = self._ordered_moves(engine, color)
+        if hash_move in moves:
+            moves.remove(hash_move); moves.insert(0, hash_move)
+        sure, chances = [], [] # Captures that can miss are valued once the sure moves are known
+        for move in moves:
+            scored = self._score_move(engine, move, color, depth, alpha, beta)
+            if scored is None: continue
+            score, prob = scored
+            if prob < 1.0:
+                chances.append((score, prob, move))
+                continue
+            sure.append(move)
+            if score > best: best = score; best_move = move
+            if score > alpha: alpha = score
+            if alpha >= beta: break
+        if chances and best < beta:
+            fallback = best if sure else self.evaluate_state(engine, color) # All of them missing: no move
+            values = self._retry_values(chances, fallback)
+            if sure and fallback <= alpha_orig < max(values.values()):
+                # The sure moves failed low, so `fallback` is only a bound: the plan needs it exactly
+                fallback = -INF
+                for move in sure:
+                    score, _ = self._score_move(engine, move, color, depth, -INF, INF)
+                    if score > fallback: fallback = score; best_move = move
+                values = self._retry_values(chances, fallback)
+            top = max(values, key=values.get)
+            best = fallback
+            if values[top] > best: best = values[top]; best_move = top
+        if best == -INF:
+            return self.evaluate_state(engine, color)
+
+        flag = UPPER if best <= alpha_orig else LOWER if best >= beta else EXACT
+        self.tt.store(key, depth, best, flag, best_move)
+        return best
+
+    def _ordered_moves(self, engine, color):
+        """Plain (non-split) moves, captures first by victim value."""
+        board_simple = engine.get_simple_board()
+        captures = []; quiet = []
+        for src, p_type in board_simple.items():
+            if self.get_color(p_type) != color: continue
+            for tgt in engine._get_valid_targets(src, p_type):
+                victim = board_simple.get(tgt)
+                if victim:
+                    captures.append((self.piece_values[victim.lower()], f"{src}{tgt}"))
+                else:
+                    quiet.append(f"{src}{tgt}")
+        captures.sort(reverse=True)
+        return [m for _, m in captures] + quiet
+
+    def _capture_probability(self, engine, tgt, color):
+        """Probability that moving onto `tgt` captures an enemy there (None if there is none)."""
+        idx = SQUARE_INDEX.get(tgt)
+        if idx is None: return None
+        occ = engine._occupant_color(idx)
+        if not occ or occ == color: return None
+        return engine._occupant_probability(idx)
+
+    def evaluate_state(self, engine, color):
+        return self.evaluate_board(engine.get_frontend_board(), color)
@@ -0,0 +1,231 @@
+import cmath
+import math
+import random
+
+from app.modules.tournament.engine import QuantumState, UndoRecord, SQUARES, SQUARE_INDEX, coalesce_amp, fragment_key
+
+SPLIT_REAL = complex(1.0 / math.sqrt(2), 0)
+SPLIT_IMAG = complex(0, 1.0 / math.sqrt(2))
+
+# Fragment tuple layout
+TYPE, ID, AMP, PHASE = 0, 1, 2, 3
+
+
+class ArrayQuantumState(QuantumState):
+    """
+    Same public API as QuantumState, backed by a 64-slot list indexed by square
+    number. Each slot holds a tuple of immutable (type, id, amp, phase) fragments,
+    so clone() is a single list copy and moves only replace the touched slots.
+    `board` is still available as a dict view for code that reads it directly.
+    """
+
+    def __init__(self, seed=None, fragment_epsilon=None):
+        self.squares = [()] * 64
+        super().__init__(seed, fragment_epsilon)
+
+    # --- DICT COMPATIBILITY ---
+    @property
+    def board(self):
+        return {
+            SQUARES[i]: [{'type': f[TYPE], 'amp': f[AMP], 'id': f[ID], 'phase': f[PHASE]} for f in frags]
+            for i, frags in enumerate(self.squares) if frags
+        }
+
+    @board.setter
+    def board(self, data):
+        squares = [()] * 64
+        for sq, pieces in data.items():
+            squares[SQUARE_INDEX[sq]] = tuple((p['type'], p['id'], p['amp'], p['phase']) for p in pieces)
+        self.squares = squares
+
+    def clone(self):
+        new_state = ArrayQuantumState.__new__(ArrayQuantumState)
+        new_state.__dict__.update(self.__dict__)
+        new_state.squares = self.squares[:]
+        new_state.entanglements = self.entanglements.copy()
+        return new_state
+
+    # --- HASHING ---
+    def _square_hash(self, idx, frags):
+        h = 0
+        for slot, f in enumerate(frags):
+            h ^= fragment_key(idx, slot, f[TYPE], f[ID], f[AMP])
+        return h
+
+    def compute_zobrist(self):
+        h = 0
+        for idx, frags in enumerate(self.squares):
+            if frags: h ^= self._square_hash(idx, frags)
+        return h
+
+    def _rehash(self, undo):
+        seen = set()
+        for idx, old in undo.squares:
+            if idx in seen: continue
+            seen.add(idx)
+            self.zobrist ^= self._square_hash(idx, old) ^ self._square_hash(idx, self.squares[idx])
+
+    # --- MOVE GENERATION ---
+    def _occupant_color(self, idx):
+        frags = self.squares[idx]
+        return self._get_color(frags[0][TYPE]) if frags else None
+
+    def _occupant_probability(self, idx):
+        frags = self.squares[idx]
+        return abs(frags[0][AMP]) ** 2 if frags else 0.0
+
+    # --- COMPACTION ---
+    def _compact(self, undo):
+        eps = self.fragment_epsilon
+        if not eps: return
+        squares = self.squares
+        lost = None
+        for idx, _ in undo.squares[:]: # A square listed twice is just checked twice: compacting is idempotent
+            frags = squares[idx]
+            if not frags or (len(frags) == 1 and abs(frags[0][AMP]) ** 2 >= eps): continue
+            kept = []
+            slots = {}
+            for f in frags:
+                i = slots.get(f[ID])
+                if i is None:
+                    slots[f[ID]] = len(kept)
+                    kept.append(f)
+                else:
+                    k = kept[i]
+                    kept[i] = (k[TYPE], k[ID], coalesce_amp(k[AMP], f[AMP]), k[PHASE])
+                    undo.coalesced += 1
+            survivors = []
+            for f in kept:
+                prob = abs(f[AMP]) ** 2
+                if prob >= eps:
+                    survivors.append(f)
+                    continue
+                if lost is None: lost = {}
+                lost[f[ID]] = lost.get(f[ID], 0.0) + prob
+                undo.dropped += 1
+            if len(survivors) < len(frags):
+                undo.squares.append((idx, frags))
+                squares[idx] = tuple(survivors)
+
+        if lost is None: return
+        totals = dict.fromkeys(lost, 0.0)
+        holding = []
+        for idx, frags in enumerate(squares):
+            held = False
+            for f in frags:
+                if f[ID] in totals:
+                    totals[f[ID]] += abs(f[AMP]) ** 2
+                    held = True
+            if held: holding.append(idx)
+        scale = {pid: math.sqrt((total + lost[pid]) / total) for pid, total in totals.items() if total}
+        for idx in holding:
+            frags = squares[idx]
+            if not any(f[ID] in scale for f in frags): continue
+            undo.squares.append((idx, frags))
+            squares[idx] = tuple((f[TYPE], f[ID], f[AMP] * scale[f[ID]], f[PHASE]) if f[ID] in scale else f for f in frags)
+
+    # --- MOVES ---
+    def apply_move(self, move_str, collapse=None):
+        undo = UndoRecord(move_str, self.last_measurement, self.zobrist)
+        self.last_measurement = None
+        squares = self.squares
+
+        if '^' in move_str:
+            parts = move_str.split('^')
+            m1, m2 = parts[0], parts[1]
+            src = SQUARE_INDEX.get(m1[:2]); t1 = m1[2:]; t2 = m2[2:]
+            if src is None or not squares[src]: return False
+            piece = squares[src][0]
+            if piece[TYPE].lower() == 'p': return False
+
+            valid_targets = self._get_valid_targets(m1[:2], piece[TYPE])
+            if t1 not in valid_targets or t2 not in valid_targets: return False
+            if t1 == t2: return False
+
+            i1 = SQUARE_INDEX[t1]; i2 = SQUARE_INDEX[t2]
+            undo.squares += [(src, squares[src]), (i1, squares[i1]), (i2, squares[i2])]
+            squares[src] = squares[src][1:]
+            squares[i1] += ((piece[TYPE], piece[ID], piece[AMP] * SPLIT_REAL, piece[PHASE]),)
+            squares[i2] += ((piece[TYPE], piece[ID], piece[AMP] * SPLIT_IMAG, piece[PHASE]),)
+
+            if piece[ID] not in self.entanglements:
+                self.entanglements[piece[ID]] = self._entangle_color(piece[ID])
+                undo.entangled = piece[ID]
+            self._compact(undo)
+            self._rehash(undo)
+            return undo
+
+        src = SQUARE_INDEX.get(move_str[:2]); tgt = SQUARE_INDEX.get(move_str[2:])
+        if src is None or not squares[src]: return False
+
+        piece = squares[src][0]
+        target_frags = squares[tgt] if tgt is not None else ()
+
+        for i, tp in enumerate(target_frags):
+            if tp[ID] == piece[ID]:
+                # Merge back into a fragment of the same piece
+                amp = tp[AMP] + piece[AMP]
+                if abs(amp)**2 > 1.0: amp /= abs(amp)
+                undo.squares += [(tgt, target_frags), (src, squares[src])]
+                squares[tgt] = target_frags[:i] + ((tp[TYPE], tp[ID], amp, tp[PHASE]),) + target_frags[i+1:]
+                squares[src] = squares[src][1:]
+                self._compact(undo)
+                self._rehash(undo)
+                return undo
+
+        if move_str[2:] not in self._get_valid_targets(move_str[:2], piece[TYPE]): return False
+
+        if target_frags:
+            target_prob = abs(target_frags[0][AMP]) ** 2
+            if collapse is None: collapse = random.random() <= target_prob
+            self.last_measurement = collapse
+            if not collapse: return False
+            target_frags = ()
+
+        undo.squares += [(src, squares[src]), (tgt, squares[tgt])]
+        squares[src] = squares[src][1:]
+        squares[tgt] = target_frags + (piece,)
+        self._compact(undo)
+        self._rehash(undo)
+        return undo
+
+    def undo_move(self, undo):
+        for idx, frags in reversed(undo.squares):
+            self.squares[idx] = frags
+        if undo.entangled is not None:
+            del self.entanglements[undo.entangled]
+        self.last_measurement = undo.last_measurement
+        self.zobrist = undo.zobrist
+
+    # --- READ-OUT ---
+    def get_simple_board(self):
+        return {
+            SQUARES[i]: max(frags, key=lambda f: abs(f[AMP]))[TYPE]
+            for i, frags in enumerate(self.squares) if frags
+        }
+
+    def get_frontend_board(self):
+        output = {}
+        for i, frags in enumerate(self.squares):
+            if not frags: continue
+            total_prob = sum([abs(f[AMP])**2 for f in frags])
+            if total_prob < 0.01: continue
+
+            f = frags[0]
+            phase = math.degrees(cmath.phase(f[AMP]))
+            data = {'type': f[TYPE], 'prob': min(1.0, total_prob), 'id': f[ID], 'phase': int(phase)}
+            if f[ID] in self.entanglements:
+                data['entangle_color'] = self.entanglements[f[ID]]
+            output[SQUARES[i]] = data
+        return output
+
+    def check_game_over(self):
+        white_prob = 0; black_prob = 0
+        for frags in self.squares:
+            for f in frags:
+                if f[TYPE] == 'K': white_prob += abs(f[AMP])**2
+                elif f[TYPE] == 'k': black_prob += abs(f[AMP])**2
+
+        if white_prob < 0.1: return {"game_over": True, "winner": "black"}
+        if black_prob < 0.1: return {"game_over": True, "winner": "white"}
+        return {"game_over": False}
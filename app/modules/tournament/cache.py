@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+
+from app.core import config, metrics
+from app.modules.tournament.engine import QuantumState
+from app.modules.tournament.array_engine import ArrayQuantumState
+from app.modules.tournament.models import TournamentMatch
+
+
+ENGINE_BACKENDS = {'dict': QuantumState, 'array': ArrayQuantumState}
+
+
+class MatchStateCache:
+    """
+    Bounded LRU of live QuantumState objects, keyed by match id.
+    Each entry remembers the ply it was built at, so a match row that moved
+    on (new move, rollback, edit) simply misses and gets replayed.
+    """
+
+    def __init__(self, max_entries=256, engine_cls=QuantumState):
+        self.max_entries = max_entries
+        self.engine_cls = engine_cls
+        self._entries = OrderedDict()  # match_id -> (ply, QuantumState)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, match_id, ply, moves_after, checkpoint=None, fragment_epsilon=None):
+        """
+        Returns a private copy of the match state after `ply` moves.
+        Callers are free to apply moves to it; on a miss we fall back to replay
+        (from `checkpoint` when the match row has one), reading the moves
+        through `moves_after(n)` (see QuantumState.load_moves), compacting with
+        the match's own `fragment_epsilon`.
+        """
+        with self._lock:
+            entry = self._entries.get(match_id)
+            if entry and entry[0] == ply:
+                self._entries.move_to_end(match_id)
+                self.hits += 1
+                return entry[1].clone()
+            self.misses += 1
+
+        start = time.perf_counter()
+        engine = self.engine_cls(seed=match_id, fragment_epsilon=fragment_epsilon)
+        replayed = engine.load_moves(moves_after, ply, checkpoint)
+        metrics.REPLAY_SECONDS.observe(time.perf_counter() - start)
+        metrics.REPLAY_PLIES.observe(replayed)
+        self.put(match_id, ply, engine)
+        return engine
+
+    def put(self, match_id, ply, engine):
+        """Stores a copy of `engine` as the state of `match_id` after `ply` moves."""
+        with self._lock:
+            self._entries[match_id] = (ply, engine.clone())
+            self._entries.move_to_end(match_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, match_id):
+        with self._lock:
+            self._entries.pop(match_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+match_cache = MatchStateCache(config.MATCH_CACHE_SIZE, ENGINE_BACKENDS[config.ENGINE_BACKEND])
+
+
+@event.listens_for(TournamentMatch.ply_count, "set")
+def _invalidate_on_history_change(target, value, oldvalue, initiator):
+    # Any rewrite of the history drops the cached state; writers that already
+    # hold the new state call match_cache.put() right after the assignment.
+    if target.id is not None:
+        match_cache.invalidate(target.id)
@@ -0,0 +1,167 @@
+import heapq
+import threading
+import time
+import traceback
+from sqlalchemy import func, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core import config, database
+from app.modules.tournament import logic
+from app.modules.tournament.live import live_hub
+from app.modules.tournament.models import TournamentMatch
+
+
+def deadline_of(match):
+    """When the side to move runs out of time (same arithmetic as update_clocks), None if no clock is running."""
+    if not match.is_active or not match.last_move_timestamp: return None
+    left = (match.p1_time_left or 600.0) if match.current_turn == "white" else (match.p2_time_left or 600.0)
+    return match.last_move_timestamp + left
+
+
+class ClockSweeper:
+    """
+    Ends games on time without anyone loading them. Running clocks sit in a
+    heap ordered by deadline and one thread sleeps until the earliest, so
+    thousands of clocks cost nothing between deadlines: no per-match polling.
+
+    Moves re-arm a clock with track(); the heap keeps the superseded entries
+    and skips them when they surface. What is due is re-read from the DB in
+    one query per batch (another worker may have moved since), and the
+    timeout itself is a compare-and-swap on ply_count, so a move landing at
+    the same moment wins and several app workers can sweep the same DB.
+    """
+
+    def __init__(self, batch=200, resync=60.0):
+        self.batch = batch
+        self.resync = resync
+        self._heap = []       # (deadline, match_id), stale entries included
+        self._deadlines = {}  # match_id -> its current deadline
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.timeouts = 0
+        self.sweeps = 0
+
+    # --- CLOCKS (any thread) ---
+    def track(self, match):
+        """(Re)arms `match`'s clock after a move, or drops it once the game is over."""
+        self.set_deadline(match.id, deadline_of(match))
+
+    def set_deadline(self, match_id, deadline):
+        with self._cond:
+            if deadline is None:
+                self._deadlines.pop(match_id, None)
+                return
+            if self._deadlines.get(match_id) == deadline: return
+            self._deadlines[match_id] = deadline
+            heapq.heappush(self._heap, (deadline, match_id))
+            if len(self._heap) > 2 * len(self._deadlines) + 1024:
+                self._heap = [(d, mid) for mid, d in self._deadlines.items()]
+                heapq.heapify(self._heap)
+            if self._heap[0] == (deadline, match_id): self._cond.notify()  # New earliest: wake up sooner
+
+    def _pop_due(self, now):
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now and len(due) < self.batch:
+                deadline, match_id = heapq.heappop(self._heap)
+                if self._deadlines.get(match_id) != deadline: continue  # Superseded by a later move
+                del self._deadlines[match_id]
+                due.append(match_id)
+        return due
+
+    # --- THREAD ---
+    def start(self):
+        if self._thread: return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="clock-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread: self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self):
+        next_resync = 0.0
+        while self._running:
+            now = time.time()
+            try:
+                if now >= next_resync:
+                    self._reload()
+                    next_resync = now + self.resync
+                due = self._pop_due(now)
+                if due:
+                    self._expire(due)
+                    continue
+            except Exception:
+                traceback.print_exc()  # Keep sweeping; the next reload re-arms whatever was lost
+
+            with self._cond:
+                if not self._running: return
+                wait = next_resync - now
+                if self._heap: wait = min(wait, self._heap[0][0] - now)
+                self._cond.wait(max(0.0, wait))
+
+    # --- DB ---
+    def _reload(self):
+        """Every running clock from the DB, one query (also catches games started or moved in other workers)."""
+        with database.SessionLocal() as db:
+            rows = db.query(
+                TournamentMatch.id, TournamentMatch.is_active, TournamentMatch.current_turn,
+                TournamentMatch.p1_time_left, TournamentMatch.p2_time_left, TournamentMatch.last_move_timestamp,
+            ).filter(TournamentMatch.is_active == True).all()
+        for row in rows:
+            self.set_deadline(row.id, deadline_of(row))
+
+    def _expire(self, match_ids):
+        """Settles the due matches that really are out of time, in one transaction. Returns how many timed out."""
+        table = TournamentMatch.__table__
+        settled = []
+        with database.SessionLocal() as db:
+            matches = db.query(TournamentMatch).filter(TournamentMatch.id.in_(match_ids), TournamentMatch.is_active == True).all()
+            next_ids = {m.next_match_id for m in matches if m.next_match_id}
+            following = db.query(TournamentMatch).filter(TournamentMatch.id.in_(next_ids)).all() if next_ids else []  # For advance_winner
+
+            now = time.time()
+            for match in matches:
+                deadline = deadline_of(match)
+                if deadline is None: continue
+                if deadline > now:
+                    self.set_deadline(match.id, deadline)  # Moved since we armed it
+                    continue
+
+                winner = "black" if match.current_turn == "white" else "white"
+                values = {
+                    "is_active": False,
+                    "winner_id": match.player1_id if winner == "white" else match.player2_id,
+                    "p1_time_left" if match.current_turn == "white" else "p2_time_left": 0.0,
+                }
+                swapped = db.execute(update(table).where(
+                    table.c.id == match.id, table.c.is_active == True,
+                    func.coalesce(table.c.ply_count, 0) == (match.ply_count or 0),
+                ).values(**values)).rowcount
+                if not swapped: continue  # A move (or another sweeper) got there first
+
+                for key, value in values.items(): set_committed_value(match, key, value)
+                logic.advance_winner(match, db, commit=False)
+                settled.append((match.id, winner))
+            armed = [(m.id, deadline_of(m)) for m in following]  # Next-round games whose clock just started
+            db.commit()
+
+        for match_id, deadline in armed:
+            if deadline: self.set_deadline(match_id, deadline)
+        self.sweeps += 1
+        self.timeouts += len(settled)
+        for match_id, winner in settled:
+            live_hub.publish_game_over(match_id, winner)
+        return len(settled)
+
+    def stats(self):
+        with self._cond:
+            return {"clocks": len(self._deadlines), "heap": len(self._heap), "sweeps": self.sweeps, "timeouts": self.timeouts}
+
+
+clock_sweeper = ClockSweeper(config.CLOCK_SWEEP_BATCH, config.CLOCK_RESYNC)
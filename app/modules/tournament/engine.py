@@ -2,11 +2,120 @@ import random
 import json
 import cmath
 import math
+import struct
+import functools
+
+from app.core import config
+
+# --- SNAPSHOT FORMAT ---
+# Header: magic, version, ply, #squares, #entanglements
+# Square: index (0-63), #fragments, then per fragment: type, id, amp.real, amp.imag, phase
+# Entanglement: piece id, RGB colour
+SNAPSHOT_MAGIC = b'QS'
+SNAPSHOT_VERSION = 1
+_SNAP_HEADER = struct.Struct('<2sBIHH')
+_SNAP_SQUARE = struct.Struct('<BB')
+_SNAP_FRAGMENT = struct.Struct('<cHddd')
+_SNAP_ENTANGLE = struct.Struct('<H3s')
+
+# --- SQUARE NUMBERING ---
+# Square n is file n % 8, rank n // 8 + 1 ("a1" = 0, "h8" = 63)
+SQUARES = [f"{c}{r}" for r in range(1, 9) for c in 'abcdefgh']
+SQUARE_INDEX = {sq: i for i, sq in enumerate(SQUARES)}
+
+# --- MOVE TABLES ---
+# Built once at import, indexed by square number. Target order matches the
+# order in which the original ray-walking generator produced them.
+def _offset(s, dc, dr):
+    c, r = s % 8 + dc, s // 8 + dr
+    return r * 8 + c if 0 <= c < 8 and 0 <= r < 8 else None
+
+def _step_table(deltas):
+    return [tuple(t for t in (_offset(s, dc, dr) for dc, dr in deltas) if t is not None) for s in range(64)]
+
+def _ray(s, dc, dr):
+    ray = []
+    t = _offset(s, dc, dr)
+    while t is not None:
+        ray.append(t)
+        t = _offset(t, dc, dr)
+    return tuple(ray)
+
+KNIGHT_DELTAS = [(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)]
+KING_DELTAS = [(dc, dr) for dc in (-1, 0, 1) for dr in (-1, 0, 1) if dc or dr]
+ROOK_DIRS = [(0,1),(0,-1),(1,0),(-1,0)]
+BISHOP_DIRS = [(1,1),(1,-1),(-1,1),(-1,-1)]
+
+KNIGHT_TARGETS = _step_table(KNIGHT_DELTAS)
+KING_TARGETS = _step_table(KING_DELTAS)
+STEP_TARGETS = {'n': KNIGHT_TARGETS, 'k': KING_TARGETS}
+
+# RAYS[(dc, dr)][s]: squares walked from s in that direction, nearest first
+RAYS = {d: [_ray(s, *d) for s in range(64)] for d in ROOK_DIRS + BISHOP_DIRS}
+SLIDER_RAYS = {
+    p: [tuple(RAYS[d][s] for d in dirs if RAYS[d][s]) for s in range(64)]
+    for p, dirs in (('r', ROOK_DIRS), ('b', BISHOP_DIRS), ('q', ROOK_DIRS + BISHOP_DIRS))
+}
+
+# PAWN_PUSHES[color][s] = (one step, double step from the start rank); PAWN_CAPTURES[color][s] = diagonals
+PAWN_PUSHES = {
+    color: [(_offset(s, 0, dr), _offset(s, 0, 2 * dr) if s // 8 == start else None) for s in range(64)]
+    for color, dr, start in (('white', 1, 1), ('black', -1, 6))
+}
+PAWN_CAPTURES = {
+    color: [tuple(t for t in (_offset(s, -1, dr), _offset(s, 1, dr)) if t is not None) for s in range(64)]
+    for color, dr in (('white', 1), ('black', -1))
+}
+
+# --- ZOBRIST HASHING ---
+# The position key is the XOR of one key per fragment: square, slot within the
+# square, type, id and amplitude quantised to 1/AMP_QUANTUM. Moves only rehash
+# the squares they touch. Entanglement colours are cosmetic and not hashed.
+AMP_QUANTUM = 1 << 20
+_MASK64 = (1 << 64) - 1
+_zrng = random.Random(0x5EED)
+ZOBRIST_SQUARE = [_zrng.getrandbits(64) for _ in range(64)]
+ZOBRIST_ID = [_zrng.getrandbits(64) for _ in range(128)]
+ZOBRIST_TYPE = {t: _zrng.getrandbits(64) for t in 'PNBRQKpnbrqk'}
+ZOBRIST_BLACK_TO_MOVE = _zrng.getrandbits(64) # Not part of QuantumState; searches XOR it in
+
+@functools.lru_cache(maxsize=1 << 16)
+def fragment_key(idx, slot, p_type, pid, amp):
+    x = ZOBRIST_SQUARE[idx] ^ ZOBRIST_ID[pid & 127] ^ ZOBRIST_TYPE[p_type] ^ (slot * 0x9E3779B97F4A7C15)
+    x ^= (round(amp.real * AMP_QUANTUM) & 0xFFFFFFFF) | ((round(amp.imag * AMP_QUANTUM) & 0xFFFFFFFF) << 32)
+    # splitmix64 finaliser, so nearby amplitudes land far apart
+    x &= _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+# --- COMPACTION ---
+def coalesce_amp(a, b):
+    """One amplitude carrying the probability of both, in the phase of the larger (unlike a merge move, no interference)."""
+    return cmath.rect(math.sqrt(abs(a) ** 2 + abs(b) ** 2), cmath.phase(a if abs(a) >= abs(b) else b))
+
+class UndoRecord:
+    """What apply_move() changed, so undo_move() can revert it in place."""
+    __slots__ = ('move', 'squares', 'entangled', 'last_measurement', 'zobrist', 'coalesced', 'dropped')
+
+    def __init__(self, move, last_measurement, zobrist):
+        self.move = move
+        self.zobrist = zobrist
+        self.squares = [] # (square, pieces before the move), or None if the square was absent
+        self.entangled = None # piece id given an entanglement colour by this move
+        self.last_measurement = last_measurement
+        self.coalesced = 0 # Fragments folded into another of the same piece by the compaction after the move
+        self.dropped = 0 # Fragments removed by it as vanishing
 
 class QuantumState:
-    def __init__(self):
+    def __init__(self, seed=None, fragment_epsilon=None):
         self.board = self._init_board()
         self.entanglements = {} 
+        self.seed = seed # Per-match seed: makes entanglement colours reproducible on replay
+        self.last_measurement = None # Outcome of the capture measured by the last apply_move (None if no capture)
+        # Fragments less likely than this are dropped after each move (0 = no compaction)
+        self.fragment_epsilon = config.FRAGMENT_EPSILON if fragment_epsilon is None else fragment_epsilon
+        self.zobrist = self.compute_zobrist() # Incrementally updated position hash
         self.cols = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h']
         self.piece_values = {'p': 10, 'n': 30, 'b': 30, 'r': 50, 'q': 90, 'k': 900}
 
@@ -28,7 +137,9 @@ class QuantumState:
     # --- CRITICAL FIX: Proper Cloning ---
     def clone(self):
         """Creates a deep copy of the state preserving Complex Numbers."""
-        new_state = QuantumState()
+        # Skip __init__: no need to build (and hash) a starting board just to replace it
+        new_state = QuantumState.__new__(QuantumState)
+        new_state.__dict__.update(self.__dict__)
         new_board = {}
         for sq, pieces in self.board.items():
             new_pieces = []
@@ -46,71 +157,145 @@ class QuantumState:
     def _get_color(self, p_type):
         return 'white' if p_type.isupper() else 'black'
 
-    def _is_on_board(self, c, r):
-        return 0 <= c < 8 and 1 <= r <= 8
+    def _entangle_color(self, pid):
+        # Derived from (seed, piece id) instead of the global RNG, so replays repaint identically
+        return f"#{random.Random(f'{self.seed}:{pid}').randint(0, 0xFFFFFF):06x}"
+
+    def _occupant_color(self, idx):
+        pieces = self.board.get(SQUARES[idx])
+        return self._get_color(pieces[0]['type']) if pieces else None
+
+    def _occupant_probability(self, idx):
+        # Probability of the fragment a capture on this square would measure
+        pieces = self.board.get(SQUARES[idx])
+        return abs(pieces[0]['amp']) ** 2 if pieces else 0.0
 
     def _get_valid_targets(self, src, p_type):
-        c_idx = self.cols.index(src[0])
-        r_idx = int(src[1])
+        s = SQUARE_INDEX[src]
         color = self._get_color(p_type)
         type_lower = p_type.lower()
+        occupant = self._occupant_color
         valid_targets = []
 
-        def add_if_valid(c, r, check_path=False):
-            if not self._is_on_board(c, r): return False
-            tgt = f"{self.cols[c]}{r}"
-            
-            if check_path:
-                if tgt in self.board and self.board[tgt]:
-                    if self._get_color(self.board[tgt][0]['type']) != color:
-                        valid_targets.append(tgt)
-                    return False
-                else:
-                    valid_targets.append(tgt)
-                    return True
-            else:
-                if tgt in self.board and self.board[tgt]:
-                    if self._get_color(self.board[tgt][0]['type']) != color:
-                        valid_targets.append(tgt)
-                else:
-                    valid_targets.append(tgt)
-                return True
-
         if type_lower == 'p':
-            direction = 1 if color == 'white' else -1
-            f1 = f"{self.cols[c_idx]}{r_idx + direction}"
-            if self._is_on_board(c_idx, r_idx + direction) and (f1 not in self.board or not self.board[f1]):
-                valid_targets.append(f1)
-                start = 2 if color == 'white' else 7
-                f2 = f"{self.cols[c_idx]}{r_idx + direction*2}"
-                if r_idx == start and (f2 not in self.board or not self.board[f2]):
-                    valid_targets.append(f2)
-            for dc in [-1, 1]:
-                if self._is_on_board(c_idx + dc, r_idx + direction):
-                    tgt = f"{self.cols[c_idx+dc]}{r_idx + direction}"
-                    if tgt in self.board and self.board[tgt] and self._get_color(self.board[tgt][0]['type']) != color:
-                        valid_targets.append(tgt)
-
-        elif type_lower == 'n':
-            for dc, dr in [(-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1)]:
-                add_if_valid(c_idx+dc, r_idx+dr)
-
-        elif type_lower == 'k':
-            for dc in [-1,0,1]:
-                for dr in [-1,0,1]:
-                    if dc or dr: add_if_valid(c_idx+dc, r_idx+dr)
+            one, two = PAWN_PUSHES[color][s]
+            if one is not None and not occupant(one):
+                valid_targets.append(SQUARES[one])
+                if two is not None and not occupant(two):
+                    valid_targets.append(SQUARES[two])
+            for t in PAWN_CAPTURES[color][s]:
+                occ = occupant(t)
+                if occ and occ != color:
+                    valid_targets.append(SQUARES[t])
+
+        elif type_lower in STEP_TARGETS:
+            for t in STEP_TARGETS[type_lower][s]:
+                if occupant(t) != color:
+                    valid_targets.append(SQUARES[t])
 
         else:
-            dirs = []
-            if type_lower in ['r','q']: dirs += [(0,1),(0,-1),(1,0),(-1,0)]
-            if type_lower in ['b','q']: dirs += [(1,1),(1,-1),(-1,1),(-1,-1)]
-            for dc, dr in dirs:
-                for i in range(1, 8):
-                    if not add_if_valid(c_idx + dc*i, r_idx + dr*i, check_path=True): break
-        
+            for ray in SLIDER_RAYS[type_lower][s]:
+                for t in ray:
+                    occ = occupant(t)
+                    if occ != color:
+                        valid_targets.append(SQUARES[t])
+                    if occ: break
+
         return valid_targets
 
-    def apply_move(self, move_str):
+    # --- HASHING ---
+    def _square_hash(self, sq, pieces):
+        idx = SQUARE_INDEX[sq]
+        h = 0
+        for slot, p in enumerate(pieces or ()):
+            h ^= fragment_key(idx, slot, p['type'], p['id'], p['amp'])
+        return h
+
+    def compute_zobrist(self):
+        """Full position hash; apply_move()/undo_move() keep self.zobrist in sync incrementally."""
+        h = 0
+        for sq, pieces in self.board.items():
+            h ^= self._square_hash(sq, pieces)
+        return h
+
+    def _rehash(self, undo):
+        # XOR out each touched square's old contents and XOR in the new ones
+        seen = set()
+        for sq, old in undo.squares:
+            if sq in seen: continue
+            seen.add(sq)
+            self.zobrist ^= self._square_hash(sq, old) ^ self._square_hash(sq, self.board.get(sq))
+
+    def _save_square(self, undo, sq):
+        # Moves replace square lists and piece dicts instead of mutating them,
+        # so keeping a reference to the old list is a full backup
+        undo.squares.append((sq, self.board.get(sq)))
+
+    # --- COMPACTION ---
+    def _compact(self, undo):
+        """
+        Tidies the squares a move touched: fragments of one piece sharing a
+        square become one, and fragments less likely than fragment_epsilon are
+        dropped, their probability going to the piece's other fragments so its
+        total stays the same. Changed squares are saved to `undo`, which also
+        counts what was removed.
+        """
+        eps = self.fragment_epsilon
+        if not eps: return
+        lost = None # piece id -> probability dropped
+        for sq, _ in undo.squares[:]: # A square listed twice is just checked twice: compacting is idempotent
+            pieces = self.board.get(sq)
+            if not pieces or (len(pieces) == 1 and abs(pieces[0]['amp']) ** 2 >= eps): continue
+            kept = []
+            slots = {}
+            for p in pieces:
+                i = slots.get(p['id'])
+                if i is None:
+                    slots[p['id']] = len(kept)
+                    kept.append(p)
+                else:
+                    kept[i] = dict(kept[i], amp=coalesce_amp(kept[i]['amp'], p['amp']))
+                    undo.coalesced += 1
+            survivors = []
+            for p in kept:
+                prob = abs(p['amp']) ** 2
+                if prob >= eps:
+                    survivors.append(p)
+                    continue
+                if lost is None: lost = {}
+                lost[p['id']] = lost.get(p['id'], 0.0) + prob
+                undo.dropped += 1
+            if len(survivors) < len(pieces):
+                self._save_square(undo, sq)
+                self.board[sq] = survivors
+
+        if lost is None: return
+        # One pass over the board for every piece that lost something: what is left of it, and where
+        totals = dict.fromkeys(lost, 0.0)
+        holding = []
+        for sq, pieces in self.board.items():
+            held = False
+            for p in pieces:
+                if p['id'] in totals:
+                    totals[p['id']] += abs(p['amp']) ** 2
+                    held = True
+            if held: holding.append(sq)
+        scale = {pid: math.sqrt((total + lost[pid]) / total) for pid, total in totals.items() if total} # 0: nothing left of the piece
+        for sq in holding:
+            pieces = self.board[sq]
+            if not any(p['id'] in scale for p in pieces): continue
+            self._save_square(undo, sq)
+            self.board[sq] = [dict(p, amp=p['amp'] * scale[p['id']]) if p['id'] in scale else p for p in pieces]
+
+    def apply_move(self, move_str, collapse=None):
+        """
+        Applies a move, returning an UndoRecord (truthy) on success or False if it
+        is illegal or the capture measurement fails.
+        `collapse` forces the outcome of a probabilistic capture (True = the target
+        collapses onto its square and is captured); by default it is rolled.
+        """
+        undo = UndoRecord(move_str, self.last_measurement, self.zobrist)
+        self.last_measurement = None
         if '^' in move_str:
             parts = move_str.split('^')
             m1, m2 = parts[0], parts[1]
@@ -124,8 +309,8 @@ class QuantumState:
             if t1 not in valid_targets or t2 not in valid_targets: return False
             if t1 == t2: return False
 
-            self.board[src].pop(0)
-            if not self.board[src]: del self.board[src]
+            for sq in (src, t1, t2): self._save_square(undo, sq)
+            self.board[src] = self.board[src][1:]
             
             factor_real = complex(1.0/math.sqrt(2), 0)
             factor_imag = complex(0, 1.0/math.sqrt(2))
@@ -133,12 +318,15 @@ class QuantumState:
             p1 = piece.copy(); p1['amp'] = piece['amp'] * factor_real
             p2 = piece.copy(); p2['amp'] = piece['amp'] * factor_imag
             
-            self.board.setdefault(t1, []).append(p1)
-            self.board.setdefault(t2, []).append(p2)
+            self.board[t1] = self.board.get(t1, []) + [p1]
+            self.board[t2] = self.board.get(t2, []) + [p2]
             
             if piece['id'] not in self.entanglements:
-                self.entanglements[piece['id']] = f"#{random.randint(0, 0xFFFFFF):06x}"
-            return True
+                self.entanglements[piece['id']] = self._entangle_color(piece['id'])
+                undo.entangled = piece['id']
+            self._compact(undo)
+            self._rehash(undo)
+            return undo
 
         src = move_str[:2]; tgt = move_str[2:]
         if src not in self.board or not self.board[src]: return False
@@ -157,26 +345,44 @@ class QuantumState:
 
         if is_merge:
             target_list = self.board[tgt]
-            for tp in target_list:
+            for i, tp in enumerate(target_list):
                 if tp['id'] == piece['id']:
-                    tp['amp'] += piece['amp']
-                    prob = abs(tp['amp'])**2
-                    if prob > 1.0: tp['amp'] /= abs(tp['amp'])
-                    self.board[src].pop(0)
-                    if not self.board[src]: del self.board[src]
-                    return True
+                    amp = tp['amp'] + piece['amp']
+                    prob = abs(amp)**2
+                    if prob > 1.0: amp /= abs(amp)
+                    for sq in (tgt, src): self._save_square(undo, sq)
+                    self.board[tgt] = target_list[:i] + [dict(tp, amp=amp)] + target_list[i+1:]
+                    self.board[src] = self.board[src][1:]
+                    self._compact(undo)
+                    self._rehash(undo)
+                    return undo
             return False
 
         if tgt in self.board and self.board[tgt]:
             target_piece = self.board[tgt][0]
             target_prob = abs(target_piece['amp']) ** 2
-            if random.random() > target_prob: return False 
-            else: self.board[tgt] = []
+            if collapse is None: collapse = random.random() <= target_prob
+            self.last_measurement = collapse
+            if not collapse: return False 
         
-        p = self.board[src].pop(0)
-        if not self.board[src]: del self.board[src]
-        self.board.setdefault(tgt, []).append(p)
-        return True
+        for sq in (src, tgt): self._save_square(undo, sq)
+        p = self.board[src][0]
+        self.board[src] = self.board[src][1:]
+        # A collapsed capture clears whatever was on the target
+        self.board[tgt] = [p] if self.last_measurement else self.board.get(tgt, []) + [p]
+        self._compact(undo)
+        self._rehash(undo)
+        return undo
+
+    def undo_move(self, undo):
+        """Reverts the move described by an UndoRecord returned from apply_move()."""
+        for sq, pieces in reversed(undo.squares):
+            if pieces is None: del self.board[sq]
+            else: self.board[sq] = pieces
+        if undo.entangled is not None:
+            del self.entanglements[undo.entangled]
+        self.last_measurement = undo.last_measurement
+        self.zobrist = undo.zobrist
 
     def get_simple_board(self):
         output = {}
@@ -212,12 +418,75 @@ class QuantumState:
         if black_prob < 0.1: return {"game_over": True, "winner": "white"}
         return {"game_over": False}
 
-    def load_game(self, hist):
+    # --- SNAPSHOTS ---
+    def to_snapshot(self, ply=0):
+        """Packs the board, amplitudes, ids and entanglements into a compact binary checkpoint."""
+        squares = list(self.board.items())
+        out = [_SNAP_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, ply, len(squares), len(self.entanglements))]
+        for sq, pieces in squares:
+            out.append(_SNAP_SQUARE.pack(SQUARE_INDEX[sq], len(pieces)))
+            for p in pieces:
+                out.append(_SNAP_FRAGMENT.pack(p['type'].encode(), p['id'], p['amp'].real, p['amp'].imag, p['phase']))
+        for pid, color in self.entanglements.items():
+            out.append(_SNAP_ENTANGLE.pack(pid, bytes.fromhex(color[1:])))
+        return b''.join(out)
+
+    def restore_snapshot(self, data):
+        """Replaces this state with a checkpoint made by to_snapshot(). Returns the checkpoint ply."""
+        magic, version, ply, n_squares, n_entangled = _SNAP_HEADER.unpack_from(data, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot (magic={magic!r}, version={version})")
+        offset = _SNAP_HEADER.size
+        board = {}
+        for _ in range(n_squares):
+            idx, count = _SNAP_SQUARE.unpack_from(data, offset)
+            offset += _SNAP_SQUARE.size
+            pieces = []
+            for _ in range(count):
+                p_type, pid, real, imag, phase = _SNAP_FRAGMENT.unpack_from(data, offset)
+                offset += _SNAP_FRAGMENT.size
+                pieces.append({'type': p_type.decode(), 'amp': complex(real, imag), 'id': pid, 'phase': phase})
+            board[SQUARES[idx]] = pieces
+        entanglements = {}
+        for _ in range(n_entangled):
+            pid, rgb = _SNAP_ENTANGLE.unpack_from(data, offset)
+            offset += _SNAP_ENTANGLE.size
+            entanglements[pid] = f"#{rgb.hex()}"
+        self.board = board
+        self.entanglements = entanglements
+        self.zobrist = self.compute_zobrist()
+        return ply
+
+    def load_game(self, hist, checkpoint=None):
+        """
+        Replays `hist` (comma-joined), resuming from `checkpoint` (if any) so only the tail is replayed.
+        Only accepted moves reach the history, so every capture in it is replayed as
+        collapsed: the result is a pure function of the stored data.
+        """
         if not hist: return
-        for m in hist.split(','): self.apply_move(m)
+        moves = hist.split(',')
+        self.load_moves(lambda after: moves[after:], len(moves), checkpoint)
+
+    def load_moves(self, moves_after, ply, checkpoint=None):
+        """
+        Same as load_game() for a history of `ply` moves stored elsewhere:
+        `moves_after(n)` yields the moves after ply n in order, so only the
+        tail past the checkpoint is ever read. Returns how many moves were replayed.
+        """
+        start = 0
+        if checkpoint:
+            start = self.restore_snapshot(checkpoint)
+            if start > ply:
+                # Stale checkpoint from a longer history: start over
+                self.board = self._init_board(); self.entanglements = {}
+                self.zobrist = self.compute_zobrist()
+                start = 0
+        if start == ply: return 0
+        for m in moves_after(start): self.apply_move(m, collapse=True)
+        return ply - start
 
 QuantumEngine = QuantumState
-def get_board_state(h):
-    e = QuantumState()
+def get_board_state(h, seed=None):
+    e = QuantumState(seed)
     e.load_game(h)
     return {"board_data": e.get_frontend_board()}
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import time
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.core import config
+
+
+def board_diff(before, after):
+    """Squares whose rendering changed between two get_frontend_board() dicts."""
+    return {
+        'set': {sq: data for sq, data in after.items() if before.get(sq) != data},
+        'clear': [sq for sq in before if sq not in after],
+    }
+
+def clock_state(match):
+    return {
+        "current_turn": match.current_turn,
+        "p1_time": match.p1_time_left,
+        "p2_time": match.p2_time_left,
+        "last_move_timestamp": match.last_move_timestamp,
+    }
+
+
+class Subscriber:
+    """One connection: a bounded queue of serialized events and the task draining it into the socket."""
+
+    def __init__(self, websocket, spectator, max_queue):
+        self.websocket = websocket
+        self.spectator = spectator
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.writer = None
+
+    async def write(self):
+        try:
+            while True:
+                await self.websocket.send_text(await self.queue.get())
+        except Exception:
+            pass
+
+
+class MatchChannel:
+    """Everyone watching one match, plus the last board sent to them (the base for the next diff)."""
+
+    def __init__(self, match_id, board, clock, ply, finished, winner):
+        self.match_id = match_id
+        self.board = board
+        self.clock = clock
+        self.ply = ply
+        self.finished = finished
+        self.winner = winner
+        self.subscribers = set()
+        self.ticker = None
+        self._state_payload = None  # Serialized "state" for new joiners, rebuilt after each move
+
+    def clock_fields(self):
+        """Clocks as of now (the side to move has been ticking since the last move)."""
+        c = self.clock
+        p1, p2 = c["p1_time"] or 600.0, c["p2_time"] or 600.0
+        now = time.time()
+        elapsed = now - (c["last_move_timestamp"] or now)
+        if c["current_turn"] == "white": p1 = max(0.0, p1 - elapsed)
+        else: p2 = max(0.0, p2 - elapsed)
+        return {"current_turn": c["current_turn"], "p1_time": p1, "p2_time": p2}
+
+    def state_payload(self):
+        if self._state_payload is None:
+            self._state_payload = json.dumps({
+                "type": "state", "ply": self.ply, "board": self.board,
+                "game_over": self.finished, "winner": self.winner, **self.clock_fields(),
+            }, default=str)
+        return self._state_payload
+
+    def initial(self):
+        return {"board": self.board, "clock": self.clock, "ply": self.ply, "game_over": self.finished, "winner": self.winner}
+
+
+class LiveHub:
+    """
+    In-process pub/sub for match events. Each update is serialized once and put
+    on every subscriber's bounded queue; a subscriber whose queue is full is
+    too slow to keep up and gets disconnected, so one stalled spectator never
+    holds up the players or the rest of the audience.
+
+    publish_*() may be called from any thread (request threads, AI pool
+    callbacks); all queue work happens on the event loop. Matches nobody is
+    watching cost nothing.
+
+    The hub is per process: a move reaches the sockets held by the app worker
+    that handled it, and no others. With several uvicorn workers a player's
+    socket may sit on another worker than their opponent's POST or the AI
+    reply, so the game page keeps a slow /state poll running whenever it is
+    waiting on the other side, socket or not.
+    """
+
+    def __init__(self, max_queue=64, tick_interval=1.0):
+        self.channels = {}
+        self.max_queue = max_queue
+        self.tick_interval = tick_interval
+        self.loop = None
+        self.joining = {}  # match_id -> clients reading their opening state
+        self.early = {}    # match_id -> newest state published while they were
+        self.published = 0
+        self.dropped = 0
+
+    # --- CONNECTIONS (event loop) ---
+    def initial(self, match_id):
+        """Opening state from a live channel, so joiners skip the DB and the replay. None if nobody is watching."""
+        channel = self.channels.get(match_id)
+        return channel.initial() if channel else None
+
+    async def serve(self, websocket: WebSocket, match_id, load_initial, spectator=False):
+        """
+        Runs one connection until it closes. `load_initial()` is awaited for the
+        match as the client should first see it: {'board', 'clock', 'ply',
+        'game_over', 'winner'}, or None to refuse (close code 4404). Moves
+        published while it runs are not lost. Nothing the client sends is acted on.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.joining[match_id] = self.joining.get(match_id, 0) + 1
+        try:
+            initial = await load_initial()
+        finally:
+            self.joining[match_id] -= 1
+            if not self.joining[match_id]: del self.joining[match_id]
+            early = self.early.get(match_id)
+            if match_id not in self.joining: self.early.pop(match_id, None)
+        if initial is None:
+            await websocket.close(code=4404)
+            return
+
+        await websocket.accept()
+        channel = self.channels.get(match_id)
+        if channel is None:
+            if early and early['ply'] >= initial['ply']: initial = early
+            elif early and early['game_over']: initial = {**initial, 'game_over': True, 'winner': early['winner']}
+            channel = MatchChannel(match_id, initial['board'], initial['clock'], initial['ply'], initial['game_over'], initial['winner'])
+            self.channels[match_id] = channel
+            channel.ticker = asyncio.create_task(self._tick(channel))
+
+        sub = Subscriber(websocket, spectator, self.max_queue)
+        sub.queue.put_nowait(channel.state_payload())
+        channel.subscribers.add(sub)
+        sub.writer = asyncio.create_task(sub.write())
+        try:
+            while True:
+                await websocket.receive_text()  # Only here to notice the close
+        except WebSocketDisconnect:
+            pass
+        except RuntimeError:
+            pass  # Dropped by _broadcast() while we were waiting
+        finally:
+            sub.writer.cancel()
+            self._remove(channel, sub)
+
+    async def _tick(self, channel):
+        while True:
+            await asyncio.sleep(self.tick_interval)
+            if not channel.finished: self._broadcast(channel, {"type": "clock", **channel.clock_fields()})
+
+    def _broadcast(self, channel, event):
+        payload = json.dumps(event, default=str)
+        self.published += 1
+        for sub in list(channel.subscribers):
+            try:
+                sub.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                self._drop(channel, sub)
+
+    def _drop(self, channel, sub):
+        self.dropped += 1
+        self._remove(channel, sub)
+        sub.writer.cancel()
+        asyncio.ensure_future(sub.websocket.close(code=1013))  # "Try again later": the client reconnects and gets a fresh state
+
+    def _remove(self, channel, sub):
+        channel.subscribers.discard(sub)
+        if channel.subscribers or self.channels.get(channel.match_id) is not channel: return
+        channel.ticker.cancel()
+        del self.channels[channel.match_id]
+
+    # --- PUBLISHING (any thread) ---
+    # Only to this process's subscribers (see the class docstring for several workers)
+    def watching(self, match_id):
+        return match_id in self.channels or match_id in self.joining
+
+    def publish_move(self, match, move, engine, ply, by_ai=False, winner=None):
+        """Sends the squares `move` changed, the new clocks and, if it ended the game, the result."""
+        if not self.watching(match.id) or self.loop is None: return
+        board = engine.get_frontend_board()
+        clock = clock_state(match)
+        self.loop.call_soon_threadsafe(self._publish_move, match.id, move, board, clock, ply, by_ai, winner)
+
+    def _publish_move(self, match_id, move, board, clock, ply, by_ai, winner):
+        channel = self.channels.get(match_id)
+        if channel is None:
+            self._hold(match_id, board=board, clock=clock, ply=ply)
+            if winner: self._publish_game_over(match_id, winner)
+            return
+        if ply <= channel.ply: return
+        diff = board_diff(channel.board, board)
+        channel.board, channel.clock, channel.ply = board, clock, ply
+        channel._state_payload = None
+        self._broadcast(channel, {"type": "move", "ply": ply, "move": move, "ai": by_ai, "diff": diff, **channel.clock_fields()})
+        if winner: self._publish_game_over(match_id, winner)
+
+    def publish_game_over(self, match_id, winner):
+        if not self.watching(match_id) or self.loop is None: return
+        self.loop.call_soon_threadsafe(self._publish_game_over, match_id, winner)
+
+    def _publish_game_over(self, match_id, winner):
+        channel = self.channels.get(match_id)
+        if channel is None:
+            self._hold(match_id, game_over=True, winner=winner)
+            return
+        channel.finished, channel.winner = True, winner
+        channel._state_payload = None
+        self._broadcast(channel, {"type": "game_over", "winner": winner})
+
+    def _hold(self, match_id, **state):
+        """Keeps what was published for a match whose first client is still loading, to open its channel with."""
+        if match_id not in self.joining: return
+        held = self.early.setdefault(match_id, {'ply': -1, 'game_over': False, 'winner': None})
+        if state.get('ply', held['ply']) < held['ply']: return
+        held.update(state)
+
+    def stats(self):
+        subs = [s for c in self.channels.values() for s in c.subscribers]
+        return {
+            "channels": len(self.channels),
+            "subscribers": len(subs),
+            "spectators": sum(1 for s in subs if s.spectator),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+live_hub = LiveHub(config.LIVE_QUEUE_SIZE, config.LIVE_CLOCK_TICK)
@@ -1,77 +1,136 @@
+import datetime
 import random
+import time
 import uuid
-from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from app.core import config
 from app.modules.tournament.models import TournamentMatch
 from app.modules.auth.models import User
 
-def generate_single_elimination(db: Session):
+def bracket_rounds(player_count):
+    """Rounds needed for `player_count` players (the field is padded to the next power of two)."""
+    rounds = 1
+    while (1 << rounds) < player_count: rounds += 1
+    return rounds
+
+def seed_slots(player_ids, size):
+    """
+    Pads the field to `size` with byes (None). Byes go one per first-round pair,
+    so nobody is drawn against another bye.
+    """
+    byes = size - len(player_ids)
+    slots = []
+    players = iter(player_ids)
+    for pair in range(size // 2):
+        slots.append(next(players))
+        slots.append(None if pair < byes else next(players))
+    return slots
+
+async def generate_single_elimination(db: AsyncSession):
     """
-    Generates a linked tournament bracket.
+    Generates a full linked single-elimination bracket for any number of players.
     Does NOT delete old games (History is kept).
+
+    Bounded round-trips whatever the field size: one bulk INSERT for every
+    match, one SELECT to learn the new ids, one bulk UPDATE to link each match
+    to the one its winner goes to.
     """
-    players = db.query(User).filter(User.username != "CPU_AI").all()
-    if len(players) < 2: return {"error": "Need at least 2 players."}
-    
+    player_ids = list((await db.scalars(select(User.id).where(User.username != "CPU_AI"))).all())
+    if len(player_ids) < 2: return {"error": "Need at least 2 players."}
+
     # Generate unique Tournament ID
     tourney_id = str(uuid.uuid4())[:8]
-    random.shuffle(players)
+    random.shuffle(player_ids)
+
+    rounds = bracket_rounds(len(player_ids))
+    slots = seed_slots(player_ids, 1 << rounds)
+
+    # Who already sits in each match: round 1 from the draw, round 2 from byes, later rounds empty
+    occupants = {1: [(slots[i], slots[i + 1]) for i in range(0, len(slots), 2)]}
+    for r in range(2, rounds + 1):
+        prev = occupants[r - 1]
+        occupants[r] = [
+            (_bye_winner(prev[2 * j]), _bye_winner(prev[2 * j + 1])) if r == 2 else (None, None)
+            for j in range(len(prev) // 2)
+        ]
 
-    # Determine Bracket Size (nearest power of 2)
-    # Simple implementation: Just pair them up for Round 1
-    # Note: Full binary tree generation is complex, this is a simplified 1-round setup
-    # checking for even numbers.
-    
-    matches = []
-    
-    # Create Matches
-    # For a scalable system, you'd build a binary tree.
-    # Here we just create Round 1 pairs. 
-    # If you want progression, we need empty matches for Round 2.
-    
-    # 1. Create Round 1 Matches
-    round1_matches = []
-    for i in range(0, len(players), 2):
-        if i+1 < len(players):
-            m = TournamentMatch(
-                tournament_id=tourney_id,
-                round_number=1,
-                player1_id=players[i].id,
-                player2_id=players[i+1].id,
-                board_state="",
-                is_active=True,
-                current_turn="white"
-            )
-            db.add(m)
-            round1_matches.append(m)
-    
-    db.flush() # Get IDs
-    
-    # 2. Create Round 2 (Finals/Semis) placeholders if needed
-    # (Simplified: If 2 matches in R1, create 1 match in R2)
-    if len(round1_matches) >= 2:
-        for i in range(0, len(round1_matches), 2):
-            if i+1 < len(round1_matches):
-                # Create Next Round Match (Empty Players)
-                next_m = TournamentMatch(
-                    tournament_id=tourney_id,
-                    round_number=2,
-                    player1_id=None, # Waiting for winner
-                    player2_id=None,
-                    board_state="",
-                    is_active=False # Inactive until filled
-                )
-                db.add(next_m)
-                db.flush()
-                
-                # Link R1 matches to R2
-                m1 = round1_matches[i]
-                m2 = round1_matches[i+1]
-                
-                m1.next_match_id = next_m.id
-                m1.next_match_slot = 1
-                
-                m2.next_match_id = next_m.id
-                m2.next_match_slot = 2
+    # 1. Every match of every round in one bulk insert
+    rows = []
+    for r in range(1, rounds + 1):
+        for pos, (p1, p2) in enumerate(occupants[r]):
+            rows.append({
+                "tournament_id": tourney_id,
+                "round_number": r,
+                "bracket_position": pos,
+                "player1_id": p1,
+                "player2_id": p2,
+                "winner_id": p1 if r == 1 and p2 is None else None, # Bye: settled on creation
+                "board_state": "",
+                "ply_count": 0,
+                "is_active": bool(p1 and p2),
+                "current_turn": "white",
+            })
+    await db.execute(insert(TournamentMatch.__table__), rows) # Core insert: one executemany, even with NULL players
+
+    # 2. Link each match to the one its winner advances to
+    ids = {
+        (r, pos): mid for mid, r, pos in await db.execute(select(
+            TournamentMatch.id, TournamentMatch.round_number, TournamentMatch.bracket_position
+        ).where(TournamentMatch.tournament_id == tourney_id))
+    }
+    links = [
+        {"match_id": mid, "next_match_id": ids[(r + 1, pos // 2)], "next_match_slot": (pos % 2) + 1}
+        for (r, pos), mid in ids.items() if r < rounds
+    ]
+    table = TournamentMatch.__table__
+    if links: await db.execute(update(table).where(table.c.id == bindparam("match_id")), links)
+
+    await db.commit()
+    return {"success": True, "tournament_id": tourney_id, "players": len(player_ids), "rounds": rounds}
+
+def _bye_winner(pair):
+    """The player who advances from a first-round bye, None while the match still has to be played."""
+    p1, p2 = pair
+    return p1 if p2 is None and p1 is not None else None
+
+def advance_winner(match, db: Session, commit=True):
+    """Promotes the winner to the next bracket round."""
+    if match.next_match_id and match.winner_id:
+        next_match = db.get(TournamentMatch, match.next_match_id) # No query if the caller preloaded it
+        if next_match:
+            if match.next_match_slot == 1:
+                next_match.player1_id = match.winner_id
+            elif match.next_match_slot == 2:
+                next_match.player2_id = match.winner_id
+            
+            # If both slots filled, activate match (its clock starts now, not when the bracket was drawn)
+            if next_match.player1_id and next_match.player2_id:
+                next_match.is_active = True
+                next_match.last_move_timestamp = time.time()
+            
+            if commit: db.commit()
+
+async def bracket_page(db: AsyncSession, tournament_id=None, status="recent", before=None, limit=None):
+    """
+    One page of matches, newest first, with both players loaded in the same query.
+    status: "active" (still being played), "recent" (active, or created in the
+    last BRACKET_RECENT_HOURS) or "all". Keyset pagination on id: pass the
+    returned cursor as `before` to get the next page. Returns (matches, cursor or None).
+    """
+    limit = limit or config.BRACKET_PAGE_SIZE
+    q = select(TournamentMatch).options(
+        joinedload(TournamentMatch.player1), joinedload(TournamentMatch.player2)
+    )
+    if tournament_id: q = q.where(TournamentMatch.tournament_id == tournament_id)
+    if status == "active":
+        q = q.where(TournamentMatch.is_active == True)
+    elif status == "recent":
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=config.BRACKET_RECENT_HOURS)
+        q = q.where(or_(TournamentMatch.is_active == True, TournamentMatch.created_at >= cutoff))
+    if before: q = q.where(TournamentMatch.id < before)
 
-    db.commit()
-    return {"success": True, "tournament_id": tourney_id}
+    matches = (await db.scalars(q.order_by(TournamentMatch.id.desc()).limit(limit + 1))).all()
+    cursor = matches[limit - 1].id if len(matches) > limit else None
+    return matches[:limit], cursor
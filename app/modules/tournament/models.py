@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text, Float, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Text, Float, DateTime, LargeBinary, Index
 from sqlalchemy.orm import relationship
+from app.core import config
 from app.core.database import Base
 import datetime
 import time
@@ -10,6 +11,7 @@ class TournamentMatch(Base):
     id = Column(Integer, primary_key=True, index=True)
     tournament_id = Column(String, index=True) # Groups matches into one event
     round_number = Column(Integer, default=1)
+    bracket_position = Column(Integer, nullable=True) # Index of the match within its round (0 = top)
     
     # Linking Logic
     next_match_id = Column(Integer, nullable=True) # ID of the match the winner goes to
@@ -22,7 +24,11 @@ class TournamentMatch(Base):
     
     # Game State
     is_active = Column(Boolean, default=True)
-    board_state = Column(Text, default="") 
+    board_state = Column(Text, default="") # Legacy comma-joined history, moved to match_moves on startup
+    ply_count = Column(Integer, default=0) # Number of rows in match_moves for this match
+    checkpoint = Column(LargeBinary, nullable=True) # QuantumState snapshot every CHECKPOINT_INTERVAL plies
+    # FRAGMENT_EPSILON the game was started with, and is always replayed with (NULL: from before compaction, none)
+    fragment_epsilon = Column(Float, nullable=True, default=lambda: config.FRAGMENT_EPSILON)
     current_turn = Column(String, default="white") 
     ai_difficulty = Column(String, default="normal") 
 
@@ -35,3 +41,17 @@ class TournamentMatch(Base):
     player1 = relationship("app.modules.auth.models.User", foreign_keys=[player1_id])
     player2 = relationship("app.modules.auth.models.User", foreign_keys=[player2_id])
     winner = relationship("app.modules.auth.models.User", foreign_keys=[winner_id])
+
+
+class MatchMove(Base):
+    """One accepted move. Appended once, never rewritten."""
+    __tablename__ = "match_moves"
+
+    id = Column(Integer, primary_key=True)
+    match_id = Column(Integer, ForeignKey("matches.id"), nullable=False)
+    ply = Column(Integer, nullable=False) # 1-based
+    move = Column(String, nullable=False) # "e2e4" or split "g1f3^g1h3"
+    outcome = Column(String, nullable=True) # "move", "split" or "capture" (the measurement landed)
+    timestamp = Column(Float, default=lambda: time.time())
+
+    __table_args__ = (Index("ix_match_moves_match_ply", "match_id", "ply", unique=True),)
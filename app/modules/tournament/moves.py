@@ -0,0 +1,98 @@
+import time
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.modules.tournament.engine import QuantumState
+from app.modules.tournament.models import TournamentMatch, MatchMove
+
+
+def move_outcome(move, engine):
+    """What an accepted move did, read off the engine right after apply_move()."""
+    if '^' in move: return "split"
+    return "capture" if engine.last_measurement else "move"
+
+class MoveConflict(Exception):
+    """Another move reached the match first: the ply this one was played against is gone."""
+
+def append_move(db: Session, match, move, outcome):
+    """
+    Adds one row to match_moves and bumps the match's ply. The caller commits.
+
+    The bump is a compare-and-swap on ply_count (UPDATE ... WHERE ply_count =
+    the ply we replayed), so two writers that read the same ply can't both
+    land, whichever process or worker they run in. The loser gets
+    MoveConflict; the unique (match_id, ply) index backs this up at commit.
+    """
+    ply = match.ply_count or 0
+    table = TournamentMatch.__table__
+    swapped = db.execute(
+        update(table).where(table.c.id == match.id, func.coalesce(table.c.ply_count, 0) == ply).values(ply_count=ply + 1)
+    ).rowcount
+    if swapped != 1: raise MoveConflict(match.id)
+    set_committed_value(match, 'ply_count', ply + 1)
+    db.add(MatchMove(match_id=match.id, ply=ply + 1, move=move, outcome=outcome, timestamp=time.time()))
+    return ply + 1
+
+def stream_moves(db: Session, match_id, after_ply=0, batch=500):
+    """Yields the moves after `after_ply` in ply order, fetched `batch` rows at a time."""
+    q = db.query(MatchMove.move).filter(MatchMove.match_id == match_id, MatchMove.ply > after_ply)
+    for (move,) in q.order_by(MatchMove.ply).yield_per(batch):
+        yield move
+
+def move_log(db: Session, match_id):
+    """Full history with outcomes and timestamps, for exports and debugging."""
+    return db.query(MatchMove).filter(MatchMove.match_id == match_id).order_by(MatchMove.ply).all()
+
+
+# --- MIGRATION ---
+def migrate_board_state(bind, batch=200):
+    """
+    Moves comma-joined `board_state` histories into match_moves, then blanks
+    them. Outcomes are recovered by replaying each game. Safe to run on every
+    startup: migrated matches have an empty board_state and are skipped.
+
+    Every app worker runs this at startup, so each match is claimed with a
+    compare-and-swap on its board_state and converted in its own
+    transaction: a worker that loses the race skips the match instead of
+    failing on the (match_id, ply) index. Returns the number of matches
+    this call converted.
+    """
+    converted = 0
+    skipped = set()
+    table = TournamentMatch.__table__
+    with Session(bind=bind) as db:
+        while True:
+            query = db.query(TournamentMatch.id, TournamentMatch.board_state).filter(
+                TournamentMatch.board_state != "", TournamentMatch.board_state.isnot(None)
+            )
+            if skipped: query = query.filter(TournamentMatch.id.notin_(skipped))
+            matches = query.limit(batch).all()
+            db.rollback()  # Don't hold the read transaction across the per-match writes
+            if not matches: break
+
+            for match_id, board_state in matches:
+                engine = QuantumState(seed=match_id, fragment_epsilon=0) # Legacy games were played without compaction
+                moves = board_state.split(',')
+                rows = []
+                for ply, move in enumerate(moves, 1):
+                    engine.apply_move(move, collapse=True)
+                    rows.append({
+                        "match_id": match_id, "ply": ply, "move": move,
+                        "outcome": move_outcome(move, engine), "timestamp": None,
+                    })
+                try:
+                    claimed = db.execute(update(table).where(
+                        table.c.id == match_id, table.c.board_state == board_state
+                    ).values(board_state="", ply_count=len(moves))).rowcount
+                    if not claimed:  # Another worker converted it first
+                        db.rollback()
+                        continue
+                    db.execute(insert(MatchMove.__table__), rows)
+                    db.commit()
+                    converted += 1
+                except IntegrityError:
+                    db.rollback()  # Moves already stored for this match: leave it as it is
+                    skipped.add(match_id)
+    return converted
@@ -1,41 +1,36 @@
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Depends, Request, WebSocket
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
 from pydantic import BaseModel
+from typing import Optional
 import time
 import json
 import random
+from functools import partial
 
-from app.core import database
+from app.core import config, database, metrics
 from app.modules.tournament import logic, models
 from app.modules.auth.models import User 
-from app.modules.tournament.engine import QuantumState, get_board_state
 from app.modules.tournament.ai import QuantumAI
+from app.modules.tournament.cache import match_cache
+from app.modules.tournament.clocks import clock_sweeper
+from app.modules.tournament.moves import MoveConflict, append_move, move_outcome, stream_moves
+from app.modules.tournament.workers import ai_pool
+from app.modules.tournament.live import live_hub, board_diff, clock_state
 
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
 class MoveRequest(BaseModel):
     move_str: str
+    ply: Optional[int] = None # The ply the client's board is at; a stale board gets a 409
 
 # --- HELPERS ---
-def advance_winner(match, db):
-    """Promotes the winner to the next bracket round."""
-    if match.next_match_id and match.winner_id:
-        next_match = db.query(models.TournamentMatch).filter(models.TournamentMatch.id == match.next_match_id).first()
-        if next_match:
-            if match.next_match_slot == 1:
-                next_match.player1_id = match.winner_id
-            elif match.next_match_slot == 2:
-                next_match.player2_id = match.winner_id
-            
-            # If both slots filled, activate match
-            if next_match.player1_id and next_match.player2_id:
-                next_match.is_active = True
-            
-            db.commit()
-
 def update_clocks(match):
     now = time.time()
     elapsed = now - (match.last_move_timestamp or now)
@@ -51,94 +46,206 @@ def update_clocks(match):
     match.last_move_timestamp = now
     return None
 
+def record_move(match, move, engine, db):
+    """
+    Appends an accepted move to match_moves, checkpointing every N plies. Returns
+    the new ply; the caller caches `engine` under it once the commit went through.
+    """
+    ply = append_move(db, match, move, move_outcome(move, engine))
+    if config.CHECKPOINT_INTERVAL and ply % config.CHECKPOINT_INTERVAL == 0:
+        match.checkpoint = engine.to_snapshot(ply)
+    return ply
+
+def replay_epsilon(match):
+    """The compaction epsilon `match` is played with: its own, 0 for games from before compaction."""
+    return match.fragment_epsilon or 0.0
+
+def load_match_state(match):
+    db = object_session(match)
+    return match_cache.get(match.id, match.ply_count or 0, lambda after: stream_moves(db, match.id, after), match.checkpoint, replay_epsilon(match))
+
+def is_ai_match(match):
+    return "CPU_AI" in [match.player1.username, match.player2.username]
+
+def ai_color_of(match):
+    return 'black' if match.player2.username == "CPU_AI" else 'white'
+
+def finish_ai_turn(match, move, engine, db):
+    """Stores an AI move already applied to `engine`, hands the turn back and settles a finished game."""
+    ply = record_move(match, move, engine, db)
+    match.current_turn = "white" if match.current_turn == "black" else "black"
+    match.last_move_timestamp = time.time()
+
+    status = engine.check_game_over()
+    if status['game_over']:
+        match.is_active = False
+        match.winner_id = match.player1_id if status['winner'] == 'white' else match.player2_id
+        logic.advance_winner(match, db) # PROMOTE AI/PLAYER
+
+    db.commit()
+    match_cache.put(match.id, ply, engine)
+    db.refresh(match)
+    clock_sweeper.track(match)
+    live_hub.publish_move(match, move, engine, match.ply_count, by_ai=True, winner=status.get('winner'))
+
 def execute_ai_turn(match, db):
+    """Plays the AI's reply inline. Returns the search stats (nodes, depth, nps...) or None if it had no legal move."""
     bot = QuantumAI()
-    engine = QuantumState()
-    engine.load_game(match.board_state or "")
-    ai_color = 'black' if match.player2.username == "CPU_AI" else 'white'
+    engine = load_match_state(match)
     diff = match.ai_difficulty or "normal"
     
-    candidates = bot.calculate_move(engine, ai_color, diff)
+    candidates = bot.calculate_move(engine, ai_color_of(match), diff)
+    metrics.observe_ai(bot.last_stats)
     
     for cand in candidates:
-        test = QuantumState()
-        test.load_game(match.board_state or "")
-        if test.apply_move(cand):
-            match.board_state = f"{match.board_state},{cand}" if match.board_state else cand
-            match.current_turn = "white" if match.current_turn == "black" else "black"
-            match.last_move_timestamp = time.time()
-            
-            status = test.check_game_over()
-            if status['game_over']:
-                match.is_active = False
-                match.winner_id = match.player1_id if status['winner'] == 'white' else match.player2_id
-                advance_winner(match, db) # PROMOTE AI/PLAYER
-            
-            db.commit()
-            db.refresh(match)
-            return True
-    return False
+        test = engine.clone()
+        undo = test.apply_move(cand)
+        if undo:
+            metrics.observe_compaction(undo)
+            finish_ai_turn(match, cand, test, db)
+            return bot.last_stats
+    return None
+
+def apply_ai_reply(expected_ply, match_id, move, stats):
+    """
+    Pool callback (runs on one of ai_pool's reply threads, so a commit waiting on
+    the DB holds up no other AI turn): commits a worker's move if the match is
+    still where it was when the turn was queued.
+    """
+    if move is None: return
+    db = database.SessionLocal()
+    try:
+        match = db.query(models.TournamentMatch).filter(models.TournamentMatch.id == match_id).first()
+        if not match or not match.is_active: return
+        if match.current_turn != ai_color_of(match): return
+        if (match.ply_count or 0) != expected_ply: return
+
+        engine = load_match_state(match)
+        # The worker already rolled any capture measurement, replay it as it landed
+        undo = engine.apply_move(move, collapse=True)
+        if undo:
+            metrics.observe_compaction(undo)
+            finish_ai_turn(match, move, engine, db)
+    except (MoveConflict, IntegrityError):
+        db.rollback() # Another worker got there first: its move stands
+    finally:
+        db.close()
+
+def open_ai_turn(match_id):
+    """Queues the AI's first move of a game it opens as white (threadpool, own session)."""
+    db = database.SessionLocal()
+    try:
+        match = db.get(models.TournamentMatch, match_id)
+        if match: schedule_ai_turn(match, db)
+    finally:
+        db.close()
+
+def ensure_ai_turn(match, db):
+    """Re-queues the AI's turn if it is due but nothing is working on it (refused when the pool was full, or lost). Returns whether it is pending."""
+    if not (match.is_active and is_ai_match(match) and match.current_turn == ai_color_of(match)): return False
+    if config.AI_WORKERS and not ai_pool.is_pending(match.id):
+        schedule_ai_turn(match, db)
+    db.refresh(match)
+    return ai_pool.is_pending(match.id)
+
+def winner_of(match):
+    if match.is_active or not match.winner_id: return None
+    return 'white' if match.winner_id == match.player1_id else 'black'
+
+def schedule_ai_turn(match, db):
+    """
+    Queues the AI's reply on the worker pool (or plays it inline when
+    AI_WORKERS is 0). Returns False if the pool refused it for being full.
+    """
+    if not config.AI_WORKERS:
+        execute_ai_turn(match, db)
+        return True
+    engine = load_match_state(match)
+    ply = match.ply_count or 0
+    return ai_pool.submit(
+        match.id, partial(apply_ai_reply, ply),
+        engine.to_snapshot(ply), config.ENGINE_BACKEND, ai_color_of(match), match.ai_difficulty or "normal", replay_epsilon(match)
+    )
+
+async def user_named(db: AsyncSession, username):
+    return await db.scalar(select(User).where(User.username == username).limit(1))
+
+def move_conflict(match_id, db):
+    """409 for a move played against a ply that is no longer current. The client resyncs and retries."""
+    db.rollback()
+    match = db.get(models.TournamentMatch, match_id)
+    return JSONResponse(status_code=409, content={
+        "success": False, "conflict": True, "message": "Board changed, resyncing",
+        "ply": match.ply_count or 0, "current_turn": match.current_turn
+    })
 
 # --- ROUTES ---
+# Routes that only query are `async def` on an AsyncSession. Those that replay
+# or search a game (play, move, state) stay plain `def` on a blocking Session:
+# FastAPI runs them in its threadpool, so the engine work never holds the event loop.
 
 @router.post("/practice")
-async def start_practice_match(request: Request, db: Session = Depends(database.get_db)):
+async def start_practice_match(request: Request, db: AsyncSession = Depends(database.get_db)):
     form = await request.form()
     diff = form.get("difficulty", "normal")
-    cpu_user = db.query(User).filter(User.username == "CPU_AI").first()
+    cpu_user = await user_named(db, "CPU_AI")
     if not cpu_user:
         cpu_user = User(username="CPU_AI", email="ai@q.com", hashed_password="x")
-        db.add(cpu_user); db.commit()
+        db.add(cpu_user); await db.commit()
 
     human = None
     if hasattr(request.state, 'user') and request.state.user:
-        human = db.query(User).filter(User.username == request.state.user['username']).first()
+        human = await user_named(db, request.state.user['username'])
     if not human:
-        human = db.query(User).filter(User.username == "Guest").first() or User(username="Guest", email="g@g.com", hashed_password="x")
-        db.add(human); db.commit()
+        human = await user_named(db, "Guest") or User(username="Guest", email="g@g.com", hashed_password="x")
+        db.add(human); await db.commit()
 
     is_white = random.choice([True, False])
     p1, p2 = (human.id, cpu_user.id) if is_white else (cpu_user.id, human.id)
 
     match = models.TournamentMatch(
         tournament_id="PRACTICE", round_number=0, player1_id=p1, player2_id=p2, 
-        board_state="", is_active=True, current_turn="white",
+        board_state="", ply_count=0, is_active=True, current_turn="white",
         p1_time_left=600.0, p2_time_left=600.0, last_move_timestamp=time.time(),
         ai_difficulty=diff
     )
-    db.add(match); db.commit(); db.refresh(match)
+    db.add(match); await db.commit()
+    clock_sweeper.track(match)
 
-    if not is_white: execute_ai_turn(match, db)
+    if not is_white: await run_in_threadpool(open_ai_turn, match.id)
     return RedirectResponse(url=f"/tournament/play/{match.id}", status_code=302)
 
 @router.get("/play/{match_id}")
-def play_match(match_id: int, request: Request, db: Session = Depends(database.get_db)):
+def play_match(match_id: int, request: Request, db: Session = Depends(database.get_sync_db)):
     match = db.query(models.TournamentMatch).filter(models.TournamentMatch.id == match_id).first()
     if not match: return RedirectResponse(url="/")
     
     update_clocks(match)
-    state = get_board_state(match.board_state or "")
+    engine = load_match_state(match)
     user_color = 'white'
     cur = request.state.user['username'] if (hasattr(request, 'state') and request.state.user) else "Guest"
     if match.player2.username == cur or match.player1.username == "CPU_AI": user_color = 'black'
     
     return templates.TemplateResponse("tournament/game.html", {
         "request": request, "match": match, 
-        "board_data": json.dumps(state['board_data'], default=str),
+        "board_data": json.dumps(engine.get_frontend_board(), default=str),
         "user_color": user_color, "current_turn": match.current_turn,
-        "p1_time": match.p1_time_left, "p2_time": match.p2_time_left
+        "p1_time": match.p1_time_left, "p2_time": match.p2_time_left,
+        "ply": match.ply_count or 0
     })
 
 @router.post("/move/{match_id}")
-def submit_move(match_id: int, move_data: MoveRequest, request: Request, db: Session = Depends(database.get_db)):
+def submit_move(match_id: int, move_data: MoveRequest, request: Request, db: Session = Depends(database.get_sync_db)):
     match = db.query(models.TournamentMatch).filter(models.TournamentMatch.id == match_id).first()
     if not match.is_active: return {"success": False, "message": "Game Over"}
 
     winner = update_clocks(match)
     if winner: 
         match.is_active = False; match.winner_id = match.player1_id if winner=='white' else match.player2_id
-        advance_winner(match, db)
+        logic.advance_winner(match, db)
         db.commit()
+        clock_sweeper.track(match)
+        live_hub.publish_game_over(match.id, winner)
         return {"success": False, "message": "Time Out", "game_over": True, "winner": winner}
 
     req_user = request.state.user['username'] if (hasattr(request, 'state') and request.state.user) else "Guest"
@@ -148,35 +255,59 @@ def submit_move(match_id: int, move_data: MoveRequest, request: Request, db: Ses
     if match.current_turn == "white" and not is_p1: return {"success": False, "message": "Not your turn"}
     if match.current_turn == "black" and not is_p2: return {"success": False, "message": "Not your turn"}
 
-    engine = QuantumState()
-    engine.load_game(match.board_state or "")
+    vs_ai = is_ai_match(match)
+    if vs_ai and config.AI_WORKERS and not ai_pool.has_capacity():
+        return {"success": False, "message": "AI is busy, try again in a moment"}
 
-    if engine.apply_move(move_data.move_str):
-        match.board_state = f"{match.board_state},{move_data.move_str}" if match.board_state else move_data.move_str
-        match.current_turn = "black" if match.current_turn == "white" else "white"
-        db.commit()
+    if move_data.ply is not None and move_data.ply != (match.ply_count or 0): return move_conflict(match.id, db)
+
+    engine = load_match_state(match)
+    before = engine.get_frontend_board()
+
+    undo = engine.apply_move(move_data.move_str)
+    if undo:
+        try:
+            ply = record_move(match, move_data.move_str, engine, db)
+            match.current_turn = "black" if match.current_turn == "white" else "white"
+            db.commit()
+        except (MoveConflict, IntegrityError):
+            return move_conflict(match.id, db)
+        match_cache.put(match.id, ply, engine)
+        metrics.observe_compaction(undo)
         
         status = engine.check_game_over()
         if status['game_over']:
             match.is_active = False
             match.winner_id = match.player1_id if status['winner'] == 'white' else match.player2_id
-            advance_winner(match, db)
+            logic.advance_winner(match, db)
             db.commit()
-            return {"success": True, "board_data": engine.get_frontend_board(), "game_over": True, "winner": status['winner']}
+        clock_sweeper.track(match)
+        live_hub.publish_move(match, move_data.move_str, engine, match.ply_count, winner=status.get('winner'))
+        if status['game_over']:
+            return {
+                "success": True, "diff": board_diff(before, engine.get_frontend_board()),
+                "ply": match.ply_count, "game_over": True, "winner": status['winner']
+            }
 
-        ai_moved = False
-        if "CPU_AI" in [match.player1.username, match.player2.username]:
-            ai_moved = execute_ai_turn(match, db)
+        ai_pending = False
+        if vs_ai:
+            try:
+                schedule_ai_turn(match, db)
+            except (MoveConflict, IntegrityError):
+                db.rollback() # Inline AI lost the race to another writer; what landed stands
             db.refresh(match)
-            engine.load_game(match.board_state)
+            engine = load_match_state(match)
             status = engine.check_game_over()
+            ai_pending = match.is_active and match.current_turn == ai_color_of(match)
 
+        # Only the squares that changed (both plies if the AI answered inline)
         return {
             "success": True, 
-            "board_data": engine.get_frontend_board(), 
+            "diff": board_diff(before, engine.get_frontend_board()),
+            "ply": match.ply_count,
             "game_over": status['game_over'], 
             "winner": status.get('winner'),
-            "ai_moved": ai_moved,
+            "ai_pending": ai_pending,
             "p1_time": match.p1_time_left,
             "p2_time": match.p2_time_left,
             "current_turn": match.current_turn
@@ -184,15 +315,96 @@ def submit_move(match_id: int, move_data: MoveRequest, request: Request, db: Ses
     
     return {"success": False, "message": "Illegal Move"}
 
+@router.get("/state/{match_id}")
+def match_state(match_id: int, db: Session = Depends(database.get_sync_db)):
+    """Polled by the game page while the AI is thinking. Re-queues an AI turn that was refused or lost."""
+    match = db.query(models.TournamentMatch).filter(models.TournamentMatch.id == match_id).first()
+    if not match: return {"success": False, "message": "Match not found"}
+
+    ai_pending = ensure_ai_turn(match, db)
+    return {
+        "success": True,
+        "board_data": load_match_state(match).get_frontend_board(),
+        "ply": match.ply_count or 0,
+        "game_over": not match.is_active,
+        "winner": winner_of(match),
+        "ai_pending": ai_pending,
+        "ai_stats": ai_pool.pop_stats(match.id),
+        "p1_time": match.p1_time_left,
+        "p2_time": match.p2_time_left,
+        "current_turn": match.current_turn
+    }
+
+def live_snapshot(match_id, player=True):
+    """Opening state for a WebSocket client (runs in the threadpool, it touches the DB and may replay the game)."""
+    db = database.SessionLocal()
+    try:
+        match = db.query(models.TournamentMatch).filter(models.TournamentMatch.id == match_id).first()
+        if not match: return None
+        if player: ensure_ai_turn(match, db)
+        return {
+            "board": load_match_state(match).get_frontend_board(),
+            "clock": clock_state(match),
+            "ply": match.ply_count or 0,
+            "game_over": not match.is_active,
+            "winner": winner_of(match),
+        }
+    finally:
+        db.close()
+
+def plays_in(match_id, username):
+    """Whether `username` is one of the match's players, None if there is no such match (threadpool, own session)."""
+    db = database.SessionLocal()
+    try:
+        match = db.query(models.TournamentMatch).filter(models.TournamentMatch.id == match_id).first()
+        if not match: return None
+        return username in {p.username for p in (match.player1, match.player2) if p}  # Later bracket rounds: players still TBD
+    finally:
+        db.close()
+
+@router.websocket("/ws/{match_id}")
+async def match_socket(websocket: WebSocket, match_id: int):
+    """Pushes moves (as board diffs), AI replies, clock ticks and the result to both players."""
+    username = websocket.session.get("username") or "Guest"  # Same identity as the HTTP routes
+    if await run_in_threadpool(plays_in, match_id, username) is False:
+        await websocket.accept()
+        await websocket.close(code=4403)  # Not a player: the page re-joins on /spectate
+        return
+    await live_hub.serve(websocket, match_id, partial(run_in_threadpool, live_snapshot, match_id))
+
+@router.websocket("/ws/{match_id}/spectate")
+async def spectate_socket(websocket: WebSocket, match_id: int):
+    """Read-only stream of a match. Joining one that is already being watched costs no DB query or replay."""
+    async def load():
+        return live_hub.initial(match_id) or await run_in_threadpool(live_snapshot, match_id, False)
+    await live_hub.serve(websocket, match_id, load, spectator=True)
+
+@router.get("/watch/{match_id}")
+async def watch_match(match_id: int, request: Request, db: AsyncSession = Depends(database.get_db)):
+    """Spectator page. The board arrives over the spectate socket, so loading it never replays the game."""
+    match = await db.get(models.TournamentMatch, match_id)
+    if not match: return RedirectResponse(url="/tournament/bracket")
+    return templates.TemplateResponse("tournament/game.html", {
+        "request": request, "match": match, "board_data": "{}", "spectator": True,
+        "user_color": "white", "current_turn": match.current_turn,
+        "p1_time": match.p1_time_left, "p2_time": match.p2_time_left, "ply": 0
+    })
+
 # Helper routes
 @router.post("/seed")
-def seed_participants(db: Session = Depends(database.get_db)): return RedirectResponse(url="/tournament/bracket", status_code=302)
+def seed_participants(): return RedirectResponse(url="/tournament/bracket", status_code=302)
 @router.get("/bracket")
-def view_bracket(request: Request, db: Session = Depends(database.get_db)):
-    # Show active and completed matches, sorted by time
-    matches = db.query(models.TournamentMatch).order_by(models.TournamentMatch.created_at.desc()).all()
-    return templates.TemplateResponse("tournament/bracket.html", {"request": request, "matches": matches})
+async def view_bracket(request: Request, tournament_id: str = None, status: str = "recent", before: int = None, db: AsyncSession = Depends(database.get_db)):
+    # Newest first, one page at a time (players come with the matches: one query per page)
+    if status not in ("active", "recent", "all"): status = "recent"
+    matches, cursor = await logic.bracket_page(db, tournament_id, status, before)
+    return templates.TemplateResponse("tournament/bracket.html", {
+        "request": request, "matches": matches, "next_cursor": cursor,
+        "tournament_id": tournament_id or "", "status": status
+    })
 @router.post("/generate")
-def start_tournament(db: Session = Depends(database.get_db)):
-    logic.generate_single_elimination(db)
+async def start_tournament(db: AsyncSession = Depends(database.get_db)):
+    result = await logic.generate_single_elimination(db)
+    if result.get("tournament_id"):
+        return RedirectResponse(url=f"/tournament/bracket?tournament_id={result['tournament_id']}&status=all", status_code=302)
     return RedirectResponse(url="/tournament/bracket", status_code=302)
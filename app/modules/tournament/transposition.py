@@ -0,0 +1,74 @@
+import sys
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results keyed by Zobrist hash.
+    Slot = key % size. On a collision the new entry wins if the slot holds a
+    result from an earlier search, or one searched no deeper than the new one.
+    A size of 0 disables the table: every probe misses and stores are dropped.
+    """
+
+    def __init__(self, max_entries=1 << 16):
+        self.size = max(0, max_entries)
+        self.slots = [None] * self.size  # (key, depth, score, flag, best_move, generation)
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replacements = 0
+        self.filled = 0
+
+    def new_search(self):
+        """Ages existing entries so they give way to results from the new search."""
+        self.generation += 1
+
+    def probe(self, key):
+        self.probes += 1
+        if not self.size: return None
+        entry = self.slots[key % self.size]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, score, flag, best_move=None):
+        if not self.size: return
+        idx = key % self.size
+        old = self.slots[idx]
+        if old is None:
+            self.filled += 1
+        elif old[0] != key:
+            if old[5] == self.generation and old[1] > depth: return
+            self.replacements += 1
+        self.slots[idx] = (key, depth, score, flag, best_move, self.generation)
+        self.stores += 1
+
+    def clear(self):
+        """Empties the table and resets its counters, as if freshly created."""
+        self.slots = [None] * self.size
+        self.generation = 0
+        self.probes = self.hits = self.stores = self.replacements = self.filled = 0
+
+    def memory_bytes(self):
+        """Approximate footprint: the slot array plus the entry tuples it references."""
+        sample = next((e for e in self.slots if e is not None), None)
+        per_entry = 0
+        if sample is not None:
+            per_entry = sys.getsizeof(sample) + sum(sys.getsizeof(v) for v in sample[:4])
+            per_entry += sys.getsizeof(sample[4]) if sample[4] else 0
+        return sys.getsizeof(self.slots) + self.filled * per_entry
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "filled": self.filled,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": (self.hits / self.probes) if self.probes else 0.0,
+            "stores": self.stores,
+            "replacements": self.replacements,
+            "memory_bytes": self.memory_bytes(),
+        }
@@ -0,0 +1,153 @@
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from app.core import config, metrics
+
+# --- WORKER PROCESS SIDE ---
+_worker_tt = None
+
+def _init_worker():
+    # Forked workers inherit the parent's RNG state; reseed so they don't all roll the same
+    random.seed()
+
+def compute_ai_move(match_id, snapshot, engine_backend, ai_color, difficulty, fragment_epsilon=None):
+    """
+    Runs in a worker process: rebuilds the position from a snapshot, searches it and
+    plays the first candidate the engine accepts (rolling any capture measurement).
+    Returns (move or None, stats).
+    """
+    global _worker_tt
+    from app.modules.tournament.ai import QuantumAI
+    from app.modules.tournament.cache import ENGINE_BACKENDS
+    from app.modules.tournament.transposition import TranspositionTable
+
+    if _worker_tt is None:
+        _worker_tt = TranspositionTable(config.AI_TT_SIZE)
+
+    start = time.perf_counter()
+    engine = ENGINE_BACKENDS[engine_backend](seed=match_id, fragment_epsilon=fragment_epsilon)
+    engine.restore_snapshot(snapshot)
+    bot = QuantumAI(tt=_worker_tt)
+    candidates = bot.calculate_move(engine, ai_color, difficulty)
+
+    for cand in candidates:
+        undo = engine.apply_move(cand)
+        if undo:
+            bot.last_stats['think_time'] = time.perf_counter() - start
+            return cand, bot.last_stats
+    return None, bot.last_stats
+
+
+# --- WEB PROCESS SIDE ---
+class AIWorkerPool:
+    """
+    Process pool for AI turns with admission control: at most `max_pending`
+    turns may be queued or running, one per match. submit() never blocks; when
+    the pool is full it returns False and the turn is retried on a later poll.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._replies = None  # Threads that run on_done (DB commits), off the executor's management thread
+        self._pending = {}  # match_id -> Future, until its on_done has returned
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self._last_stats = {}  # match_id -> stats of the latest reply, until someone reads them
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker)
+            self._replies = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ai-reply")
+        return self._executor
+
+    def submit(self, match_id, on_done, *args):
+        """
+        Queues compute_ai_move(match_id, *args). `on_done(match_id, move, stats)` is
+        called on one of the pool's reply threads once the worker replies; the
+        match counts as pending until it returns.
+        """
+        with self._lock:
+            if match_id in self._pending: return True
+            if len(self._pending) >= self.max_pending:
+                self.rejected += 1
+                return False
+            future = self._get_executor().submit(compute_ai_move, match_id, *args)
+            self._pending[match_id] = future
+            self.submitted += 1
+            replies = self._replies
+
+        def _finish(f):
+            # Runs on the executor's management thread, which also collects every other
+            # result and feeds idle workers: nothing here may block, so on_done goes elsewhere
+            try:
+                move, stats = f.result()
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                    self._pending.pop(match_id, None)
+                return
+            with self._lock:
+                self.completed += 1
+                self._last_stats[match_id] = stats
+                if len(self._last_stats) > self.max_pending * 4:
+                    self._last_stats.pop(next(iter(self._last_stats)), None)
+            metrics.observe_ai(stats)
+            try:
+                replies.submit(_deliver, move, stats)
+            except RuntimeError:  # Shutting down
+                with self._lock:
+                    self._pending.pop(match_id, None)
+
+        def _deliver(move, stats):
+            try:
+                on_done(match_id, move, stats)
+            finally:
+                # Only now: until the reply is committed, the turn is still the AI's and must not be queued again
+                with self._lock:
+                    self._pending.pop(match_id, None)
+
+        future.add_done_callback(_finish)
+        return True
+
+    def is_pending(self, match_id):
+        with self._lock:
+            return match_id in self._pending
+
+    def has_capacity(self):
+        with self._lock:
+            return len(self._pending) < self.max_pending
+
+    def pop_stats(self, match_id):
+        with self._lock:
+            return self._last_stats.pop(match_id, None)
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self.queue_depth(),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._replies.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._replies = None
+
+
+ai_pool = AIWorkerPool(max(1, config.AI_WORKERS), config.AI_QUEUE_LIMIT)
@@ -0,0 +1,91 @@
+"""
+Bracket generation on a throwaway SQLite database.
+
+    python -m benchmarks.bracket --players 4096
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base
+from app.modules.auth.models import User
+from app.modules.tournament import logic
+from app.modules.tournament.models import TournamentMatch
+
+
+def check_tree(matches, players):
+    """Every match but the final feeds exactly two slots of the next round; every player appears once."""
+    by_id = {m.id: m for m in matches}
+    feeds = {}
+    for m in matches:
+        if m.next_match_id is None: continue
+        nxt = by_id[m.next_match_id]
+        assert nxt.round_number == m.round_number + 1
+        feeds.setdefault(nxt.id, set()).add(m.next_match_slot)
+    finals = [m for m in matches if m.next_match_id is None]
+    assert len(finals) == 1
+    assert all(feeds.get(m.id) == {1, 2} for m in matches if m.round_number > 1)
+    seated = [p for m in matches if m.round_number == 1 for p in (m.player1_id, m.player2_id) if p]
+    assert sorted(seated) == sorted(players)
+
+
+async def generate(Session, repeat, statements):
+    """Times generate_single_elimination on the async engine, like the /generate route runs it."""
+    timings = []
+    for _ in range(repeat):
+        statements.clear()
+        async with Session() as db:
+            start = time.perf_counter()
+            result = await logic.generate_single_elimination(db)
+            timings.append(time.perf_counter() - start)
+        round_trips = len(statements)
+    return result, timings, round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--players', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+
+        with Session() as db:
+            db.execute(insert(User), [
+                {"username": f"player{i}", "email": f"p{i}@q.com", "hashed_password": "x"} for i in range(args.players)
+            ])
+            db.commit()
+            players = [u.id for u in db.query(User)]
+
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        statements = []
+        event.listen(async_engine.sync_engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+        async def bench():
+            try:
+                return await generate(async_sessionmaker(async_engine), args.repeat, statements)
+            finally:
+                await async_engine.dispose()
+        result, timings, round_trips = asyncio.run(bench())
+
+        with Session() as db:
+            matches = db.query(TournamentMatch).filter(TournamentMatch.tournament_id == result["tournament_id"]).all()
+        check_tree(matches, players)
+
+    byes = (1 << result["rounds"]) - args.players
+    print(f"{args.players} players, {result['rounds']} rounds, {len(matches)} matches, {byes} byes")
+    print(f"generate_single_elimination: best {min(timings) * 1000:.1f} ms, worst {max(timings) * 1000:.1f} ms")
+    print(f"round-trips per bracket: {round_trips}")
+
+
+if __name__ == '__main__':
+    main()
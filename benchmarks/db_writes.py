@@ -0,0 +1,94 @@
+"""
+Concurrent move writes on a throwaway SQLite file: the old engine setup vs build_engine()
+(tuned PRAGMAs, with DEFERRED and IMMEDIATE transactions).
+
+    python -m benchmarks.db_writes --threads 16 --moves 200
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.core.database import Base, build_engine
+from app.modules.auth import models as auth_models  # noqa: F401 (registers the users table)
+from app.modules.tournament.models import TournamentMatch, MatchMove
+from app.modules.tournament.moves import append_move, stream_moves
+
+
+def legacy_engine(url):
+    """What database.py did before it was configurable."""
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+
+def run(engine, threads, moves, readers):
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        matches = [TournamentMatch(tournament_id="BENCH", board_state="", ply_count=0) for _ in range(threads)]
+        db.add_all(matches); db.commit()
+        match_ids = [m.id for m in matches]
+
+    errors = []
+    done = threading.Event()
+
+    def writer(match_id):
+        for i in range(moves):
+            try:
+                with Session() as db:
+                    match = db.get(TournamentMatch, match_id)
+                    append_move(db, match, "e2e4", "move")
+                    match.last_move_timestamp = time.time()
+                    db.commit()
+            except OperationalError as e:
+                errors.append(str(e.orig))
+
+    def reader(match_id):
+        while not done.is_set():
+            try:
+                with Session() as db:
+                    sum(1 for _ in stream_moves(db, match_id))
+            except OperationalError as e:
+                errors.append(str(e.orig))
+
+    workers = [threading.Thread(target=writer, args=(mid,)) for mid in match_ids]
+    watchers = [threading.Thread(target=reader, args=(match_ids[i % threads],)) for i in range(readers)]
+    start = time.perf_counter()
+    for t in workers + watchers: t.start()
+    for t in workers: t.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for t in watchers: t.join()
+
+    with Session() as db:
+        written = db.query(MatchMove).count()
+    engine.dispose()
+    return {"written": written, "elapsed": elapsed, "errors": len(errors), "sample_error": errors[0] if errors else ""}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--moves', type=int, default=200)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{args.threads} writer threads x {args.moves} moves, {args.readers} reader threads\n")
+    print(f"{'setup':<12}{'writes/s':>10}{'written':>10}{'errors':>8}")
+    setups = (
+        ("before", legacy_engine),
+        ("deferred", lambda url: build_engine(url, sqlite_begin="DEFERRED")),
+        ("immediate", lambda url: build_engine(url, sqlite_begin="IMMEDIATE")),
+    )
+    for name, factory in setups:
+        with tempfile.TemporaryDirectory() as tmp:
+            r = run(factory(f"sqlite:///{os.path.join(tmp, 'bench.db')}"), args.threads, args.moves, args.readers)
+        print(f"{name:<12}{r['written'] / r['elapsed']:>10.0f}{r['written']:>10}{r['errors']:>8}  {r['sample_error']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+Engine hot-path microbenchmarks, with JSON output and baseline comparison.
+
+    python -m benchmarks.engine --json bench.json
+    python -m benchmarks.engine --baseline bench.json --threshold 0.15
+
+Every case runs on positions built from fixed seeds, so two runs time the same
+work. Times are seconds per call, best of --repeat. With --baseline the run
+exits 1 if any case got slower than baseline * (1 + threshold).
+
+A fixed pure-Python loop is timed before and after the cases (median of a few
+readings each). If the two differ by more than the threshold the machine's load
+changed under the run, and it exits 2 without comparing. --calibrate also scales
+the baseline by the loop's speed ratio between the two runs; the loop is short,
+so only use it across machines, where raw times mean nothing anyway.
+
+Baselines are not committed: timings only compare on the same machine and
+Python. Make one from the commit to compare against, on the machine that will
+check, and keep it outside the tree:
+
+    git stash && python -m benchmarks.engine --json /tmp/engine-base.json && git stash pop
+    python -m benchmarks.engine --baseline /tmp/engine-base.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+
+from app.modules.tournament.ai import QuantumAI
+from app.modules.tournament.cache import ENGINE_BACKENDS
+from app.modules.tournament.transposition import TranspositionTable
+from benchmarks.engine_repr import random_history
+
+SEED = 1234
+PIECE_TYPES = 'pnbrqk'
+HISTORY_PLIES = (50, 200, 1000)
+SPLIT = "g1f3^g1h3"
+MERGE_SETUP = ["g1f3^g1h3", "f3g5"]  # Both halves of the knight now reach g5...
+MERGE = "h3g5"                        # ...and this brings them back together
+CALIBRATION_READINGS = 5
+
+
+def best(fn, number, repeat, setup=None):
+    """Seconds per call of fn(), best of `repeat` runs of `number` calls. setup() runs untimed before each run."""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        gc.collect()
+        gc.disable()  # Like timeit: a collection landing in one run is noise, not a regression
+        try:
+            start = timeit.default_timer()
+            for i in range(number): fn(arg, i)
+            times.append(timeit.default_timer() - start)
+        finally:
+            gc.enable()
+    return min(times) / number
+
+
+def calibrate(repeat, readings=CALIBRATION_READINGS):
+    """
+    A fixed pure-Python workload (dict/list churn, like the engine's), to tell
+    machine speed from code speed. Median of `readings` timings, so one reading
+    caught by a burst of load doesn't skew it.
+    """
+    def work(_, i):
+        d = {}
+        for k in range(2000): d[k % 97] = d.get(k % 89, 0) + k
+        return sorted(d.values())
+    return statistics.median(best(work, 50, repeat) for _ in range(readings))
+
+
+def position(engine_cls, hist, seed=SEED):
+    engine = engine_cls(seed=seed)
+    engine.load_game(hist)
+    return engine
+
+
+def apply_cases(engine_cls, number, repeat):
+    """apply_move on fresh clones (cloned untimed), so each call sees the same position."""
+    start = engine_cls(seed=SEED)
+    merge_base = engine_cls(seed=SEED)
+    for m in MERGE_SETUP: assert merge_base.apply_move(m, collapse=True)
+
+    def on_clones(base, move):
+        probe = base.clone()
+        assert probe.apply_move(move, collapse=True), move
+        return best(lambda states, i: states[i].apply_move(move, collapse=True), number, repeat,
+                    setup=lambda: [base.clone() for _ in range(number)])
+
+    return {
+        'apply_move/normal': on_clones(start, "e2e4"),
+        'apply_move/split': on_clones(start, SPLIT),
+        'apply_move/merge': on_clones(merge_base, MERGE),
+    }
+
+
+def target_cases(engines, number, repeat):
+    """_get_valid_targets for every piece of each type, on the first of `engines` that still has one."""
+    cases = {}
+    for kind in PIECE_TYPES:
+        for engine in engines:
+            pieces = [(sq, p) for sq, p in sorted(engine.get_simple_board().items()) if p.lower() == kind]
+            if pieces: break
+        else:
+            continue
+        per_sweep = best(lambda _, i: [engine._get_valid_targets(sq, p) for sq, p in pieces], number, repeat)
+        cases[f'valid_targets/{kind}'] = per_sweep / len(pieces)
+    return cases
+
+
+def load_cases(engine_cls, histories, repeat):
+    return {
+        f'load_game/{plies}': best(lambda _, i: engine_cls(seed=SEED).load_game(hist), 1, repeat)
+        for plies, hist in histories.items()
+    }
+
+
+def ai_cases(engine, repeat, nodes):
+    """calculate_move per difficulty. Hard search is cut by nodes, not time, so every run searches the same tree."""
+    cases = {}
+    for difficulty in ('easy', 'normal', 'hard'):
+        def setup():
+            random.seed(SEED)  # Candidate shuffles and hard-mode splits draw from the global RNG
+            return QuantumAI(time_budget=0, node_budget=nodes, max_depth=64, tt=TranspositionTable(1 << 16))
+        cases[f'calculate_move/{difficulty}'] = best(lambda bot, i: bot.calculate_move(engine, 'white', difficulty), 1, repeat, setup)
+    return cases
+
+
+def run(backend, number, repeat, ai_nodes):
+    engine_cls = ENGINE_BACKENDS[backend]
+    histories = {plies: random_history(plies, SEED, keep_kings=True) for plies in HISTORY_PLIES}
+    midgame = position(engine_cls, histories[200])
+
+    results = {}
+    results.update(apply_cases(engine_cls, number, repeat))
+    results.update(target_cases([midgame, engine_cls(seed=SEED)], number, repeat))
+    results.update(load_cases(engine_cls, histories, repeat))
+    results['clone'] = best(lambda _, i: midgame.clone(), number, repeat)
+    results['get_frontend_board'] = best(lambda _, i: midgame.get_frontend_board(), number, repeat)
+    results.update(ai_cases(midgame, repeat, ai_nodes))
+    return results
+
+
+def compare(results, baseline, threshold, scale=1.0):
+    """
+    Prints each case against the baseline (times `scale`, the machine speed
+    ratio). Returns the names that regressed beyond `threshold`.
+    """
+    regressed = []
+    baseline = {name: secs * scale for name, secs in baseline.items()}
+    print(f"{'case':<28}{'baseline (us)':>15}{'now (us)':>12}{'change':>10}")
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<28}{'-':>15}{now * 1e6:>12.1f}{'new':>10}")
+            continue
+        change = now / base - 1
+        flag = ''
+        if change > threshold:
+            regressed.append(name)
+            flag = '  REGRESSED'
+        print(f"{name:<28}{base * 1e6:>15.1f}{now * 1e6:>12.1f}{change:>+10.1%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=sorted(ENGINE_BACKENDS), default='dict')
+    parser.add_argument('--number', type=int, default=500, help="calls per timed run of the fast cases")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--ai-nodes', type=int, default=5000, help="node budget of the hard search")
+    parser.add_argument('--json', help="write the results here (usable as a --baseline later)")
+    parser.add_argument('--baseline', help="results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.20, help="allowed slowdown before failing, 0.20 = 20%%")
+    parser.add_argument('--calibrate', action='store_true', help="scale the baseline for machine speed (comparing across machines)")
+    args = parser.parse_args()
+
+    before = calibrate(args.repeat)
+    results = run(args.backend, args.number, args.repeat, args.ai_nodes)
+    after = calibrate(args.repeat)
+    calibration = statistics.median([before, after])
+    drift = abs(after / before - 1)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'meta': {
+                    'backend': args.backend, 'seed': SEED, 'number': args.number, 'repeat': args.repeat,
+                    'ai_nodes': args.ai_nodes, 'calibration': calibration, 'calibration_drift': drift,
+                    'python': platform.python_version(), 'machine': platform.machine(),
+                    'date': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+                },
+                'results': results,
+            }, f, indent=2)
+
+    if not args.baseline:
+        print(f"{'case':<28}{'us/call':>12}")
+        for name, secs in results.items():
+            print(f"{name:<28}{secs * 1e6:>12.1f}")
+        if drift > args.threshold:
+            print(f"\nnote: machine speed changed by {drift:.0%} during the run, a poor baseline")
+        return
+
+    if drift > args.threshold:
+        print(f"machine speed changed by {drift:.0%} during the run (calibration {before * 1e6:.0f} us before, "
+              f"{after * 1e6:.0f} us after): not comparing, rerun on a quieter machine")
+        sys.exit(2)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['meta'].get('backend') != args.backend:
+        print(f"note: baseline was run on the {baseline['meta'].get('backend')} backend")
+    scale = 1.0
+    if args.calibrate and baseline['meta'].get('calibration'):
+        scale = calibration / baseline['meta']['calibration']
+        print(f"machine speed vs baseline: {1 / scale:.2f}x (baseline scaled to match)\n")
+    regressed = compare(results, baseline['results'], args.threshold, scale)
+    if regressed:
+        print(f"\n{len(regressed)} case(s) slower than baseline by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Dict-backed QuantumState vs array-backed ArrayQuantumState.
+
+    python -m benchmarks.engine_repr --plies 200 --games 5
+"""
+import argparse
+import random
+import timeit
+
+from app.modules.tournament.engine import QuantumState
+from app.modules.tournament.array_engine import ArrayQuantumState
+
+ENGINES = {'dict': QuantumState, 'array': ArrayQuantumState}
+
+
+def random_history(plies, seed, split_rate=0.15, keep_kings=False):
+    """
+    Plays random legal moves (including splits) and returns the accepted history.
+    keep_kings: never move onto a king, so the game runs the full `plies`.
+    """
+    rng = random.Random(seed)
+    engine = QuantumState(seed=seed)
+    hist = []
+    color = 'white'
+    for _ in range(plies):
+        board = engine.get_simple_board()
+        moves = []
+        for sq, p_type in board.items():
+            if engine._get_color(p_type) != color: continue
+            targets = engine._get_valid_targets(sq, p_type)
+            if keep_kings: targets = [t for t in targets if not any(p['type'].lower() == 'k' for p in engine.board.get(t, []))]
+            moves += [f"{sq}{t}" for t in targets]
+            if len(targets) > 1 and p_type.lower() != 'p' and rng.random() < split_rate:
+                t1, t2 = rng.sample(targets, 2)
+                moves.append(f"{sq}{t1}^{sq}{t2}")
+        rng.shuffle(moves)
+        for m in moves:
+            if engine.apply_move(m, collapse=True):
+                hist.append(m)
+                break
+        else:
+            break
+        if engine.check_game_over()['game_over']: break
+        color = 'black' if color == 'white' else 'white'
+    return ','.join(hist)
+
+
+def all_targets(engine):
+    for sq, p_type in engine.get_simple_board().items():
+        engine._get_valid_targets(sq, p_type)
+
+
+def bench(engine_cls, histories, number):
+    states = []
+    for seed, hist in histories:
+        e = engine_cls(seed=seed); e.load_game(hist); states.append(e)
+
+    def per_state(fn):
+        return min(timeit.repeat(lambda: [fn(e) for e in states], number=number, repeat=3)) / (number * len(states))
+
+    def replay():
+        for seed, hist in histories:
+            engine_cls(seed=seed).load_game(hist)
+
+    return {
+        'load_game': min(timeit.repeat(replay, number=1, repeat=3)) / len(histories),
+        'clone': per_state(lambda e: e.clone()),
+        'get_frontend_board': per_state(lambda e: e.get_frontend_board()),
+        'get_simple_board': per_state(lambda e: e.get_simple_board()),
+        'check_game_over': per_state(lambda e: e.check_game_over()),
+        'valid_targets (all pieces)': per_state(all_targets),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--plies', type=int, default=200)
+    parser.add_argument('--games', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    histories = [(seed, random_history(args.plies, seed)) for seed in range(args.games)]
+    avg_plies = sum(h.count(',') + 1 for _, h in histories) / len(histories)
+    print(f"{args.games} games, {avg_plies:.0f} plies on average\n")
+
+    results = {name: bench(cls, histories, args.number) for name, cls in ENGINES.items()}
+    print(f"{'operation':<28}{'dict (us)':>12}{'array (us)':>12}{'speedup':>10}")
+    for op in results['dict']:
+        d = results['dict'][op] * 1e6; a = results['array'][op] * 1e6
+        print(f"{op:<28}{d:>12.1f}{a:>12.1f}{d / a:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+End-to-end load test: concurrent clients playing practice games over HTTP.
+
+    python -m benchmarks.http_load --clients 16 --duration 60
+    python -m benchmarks.http_load --url http://127.0.0.1:8000 --clients 8
+
+Needs the dev requirements (pip install -r requirements-dev.txt).
+
+Without --url it starts its own uvicorn on a throwaway SQLite file (extra
+settings go through --env QUANTA_ENGINE=array etc.). Each client
+registers and logs in, then opens practice games at each difficulty in turn
+and plays random legal moves until the game ends or --max-plies. Reports
+p50/p95/p99 latency and throughput per endpoint, plus the AI's think time:
+from our move's response to the reply being visible, and the worker's own
+search time as reported by /state.
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from app.modules.tournament.engine import QuantumState
+
+DIFFICULTIES = ('easy', 'normal', 'hard')
+
+
+class Stats:
+    def __init__(self):
+        self.latency = defaultdict(list)  # endpoint -> seconds
+        self.errors = defaultdict(int)
+        self.ai_wait = []    # client-observed: move response -> AI reply visible
+        self.ai_search = []  # server-reported search time of hard replies
+        self.games = self.moves = self.illegal = self.conflicts = 0
+
+    async def call(self, name, request):
+        start = time.perf_counter()
+        try:
+            r = await request
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            raise
+        self.latency[name].append(time.perf_counter() - start)
+        if r.status_code >= 500: self.errors[name] += 1
+        return r
+
+
+def percentile(sorted_values, q):
+    if not sorted_values: return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def legal_moves(board_data, color, rng):
+    """Random-ordered moves for `color` on the board the server sent (targets from the engine's own move rules)."""
+    engine = QuantumState(seed=0)
+    engine.board = {
+        sq: [{'type': d['type'], 'id': d['id'], 'amp': complex(math.sqrt(d['prob']), 0)}]
+        for sq, d in board_data.items()
+    }
+    moves = []
+    for sq, d in board_data.items():
+        if engine._get_color(d['type']) != color: continue
+        moves += [f"{sq}{t}" for t in engine._get_valid_targets(sq, d['type'])]
+    rng.shuffle(moves)
+    return moves
+
+
+async def play_game(http, stats, difficulty, max_plies, poll, rng):
+    r = await stats.call("POST /tournament/practice", http.post("/tournament/practice", data={"difficulty": difficulty}))
+    match_id = int(r.headers["location"].rsplit("/", 1)[1])
+    r = await stats.call("GET /tournament/play/{id}", http.get(f"/tournament/play/{match_id}"))
+    color = re.search(r'data-user-color="(\w+)"', r.text).group(1)
+    stats.games += 1
+
+    waited_since = time.perf_counter() if color == 'black' else None  # The AI opens as white
+    for _ in range(max_plies):
+        # Wait for our turn (the AI's reply is being computed by the worker pool)
+        while True:
+            r = await stats.call("GET /tournament/state/{id}", http.get(f"/tournament/state/{match_id}"))
+            state = r.json()
+            if state.get("ai_stats") and state["ai_stats"].get("search_time"): stats.ai_search.append(state["ai_stats"]["search_time"])
+            if state["game_over"]: return
+            if state["current_turn"] == color and not state["ai_pending"]: break
+            await asyncio.sleep(poll)
+        if waited_since is not None: stats.ai_wait.append(time.perf_counter() - waited_since)
+
+        waited_since = None
+        for move in legal_moves(state["board_data"], color, rng)[:10]:
+            r = await stats.call("POST /tournament/move/{id}", http.post(f"/tournament/move/{match_id}", json={"move_str": move, "ply": state["ply"]}))
+            data = r.json()
+            if r.status_code == 409:
+                stats.conflicts += 1
+                break
+            if data.get("success"):
+                stats.moves += 1
+                if data.get("game_over"): return
+                waited_since = time.perf_counter()
+                break
+            if data.get("message") != "Illegal Move": return  # Time out, game over...
+            stats.illegal += 1  # Includes captures whose measurement failed
+        else:
+            return  # Nothing we tried was accepted
+
+
+async def client(n, base_url, stats, deadline, games, max_plies, poll, seed):
+    rng = random.Random(seed + n)
+    name = f"load{seed}_{n}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as http:
+        await stats.call("POST /auth/register", http.post("/auth/register", data={"username": name, "email": f"{name}@load.test", "password": f"pw-{name}"}))
+        await stats.call("POST /auth/login", http.post("/auth/login", data={"username": name, "password": f"pw-{name}"}))
+        for i in itertools.count():
+            if time.time() > deadline or (games and i >= games): return
+            try:
+                await play_game(http, stats, DIFFICULTIES[(n + i) % len(DIFFICULTIES)], max_plies, poll, rng)
+            except (httpx.HTTPError, ValueError, KeyError, AttributeError):
+                pass  # Counted in stats.errors (or a 500 page instead of JSON): on to the next game
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(tmp, workers, env_overrides):
+    port = free_port()
+    env = dict(os.environ, QUANTA_DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'load.db')}")
+    env.update(env_overrides)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            httpx.get(url + "/", timeout=1)
+            return proc, url
+        except httpx.HTTPError:
+            if proc.poll() is not None: sys.exit("server exited during startup")
+            time.sleep(0.1)
+    proc.terminate()
+    sys.exit("server did not come up")
+
+
+def report(stats, elapsed, clients):
+    print(f"\n{clients} clients, {elapsed:.1f} s: {stats.games} games, {stats.moves} moves "
+          f"({stats.illegal} rejected, {stats.conflicts} conflicts)\n")
+    print(f"{'endpoint':<30}{'requests':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name in sorted(stats.latency):
+        lat = sorted(stats.latency[name])
+        print(f"{name:<30}{len(lat):>9}{len(lat) / elapsed:>8.1f}"
+              f"{percentile(lat, .5) * 1000:>9.1f}{percentile(lat, .95) * 1000:>9.1f}{percentile(lat, .99) * 1000:>9.1f}"
+              f"{stats.errors[name]:>8}")
+    print()
+    for label, values in (("AI think, client view", stats.ai_wait), ("AI search (hard, server)", stats.ai_search)):
+        v = sorted(values)
+        print(f"{label:<30}{len(v):>9}{'':>8}{percentile(v, .5) * 1000:>9.1f}{percentile(v, .95) * 1000:>9.1f}{percentile(v, .99) * 1000:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help="app to load (default: start one on a throwaway database)")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help="seconds; clients finish their current game")
+    parser.add_argument('--games', type=int, default=0, help="games per client (0 = until --duration)")
+    parser.add_argument('--max-plies', type=int, default=40, help="our moves per game before moving on")
+    parser.add_argument('--poll', type=float, default=0.05, help="seconds between /state polls while the AI thinks")
+    parser.add_argument('--workers', type=int, default=1, help="uvicorn workers of the started app")
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help="setting for the started app")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    env = dict(kv.split('=', 1) for kv in args.env)
+    env.setdefault("QUANTA_BCRYPT_ROUNDS", "4")  # Measure the games, not the sign-up (benchmarks.logins covers that)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proc, url = (None, args.url) if args.url else start_server(tmp, args.workers, env)
+        try:
+            stats = Stats()
+            deadline = time.time() + args.duration
+            start = time.perf_counter()
+
+            async def run():
+                await asyncio.gather(*(
+                    client(n, url, stats, deadline, args.games, args.max_plies, args.poll, args.seed)
+                    for n in range(args.clients)
+                ))
+            asyncio.run(run())
+            report(stats, time.perf_counter() - start, args.clients)
+        finally:
+            if proc:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
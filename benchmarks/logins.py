@@ -0,0 +1,95 @@
+"""
+Concurrent logins through the app on a throwaway SQLite file, with bcrypt run
+inline on the event loop vs on the hashing thread pool.
+
+    python -m benchmarks.logins --clients 32 --logins 128 --rounds 12
+
+Needs the dev requirements (pip install -r requirements-dev.txt).
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+async def loop_stall(stop, interval=0.01):
+    """Longest the event loop went without running us: what every live game on the worker would feel."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run(app, users, clients, logins):
+    import httpx
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(logins): queue.put_nowait(users[i % len(users)])
+
+    async def client():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+            while not queue.empty():
+                name = queue.get_nowait()
+                start = time.perf_counter()
+                r = await http.post("/auth/login", data={"username": name, "password": f"pw-{name}"})
+                assert r.status_code == 302, r.status_code
+                latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    stall = asyncio.create_task(loop_stall(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, sorted(latencies), await stall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--logins', type=int, default=128)
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Before anything reads config: the app must come up on the throwaway database
+        os.environ["QUANTA_DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ["QUANTA_BCRYPT_ROUNDS"] = str(args.rounds)
+        from app.core import config, database, security
+        from app.main import app
+        from app.modules.auth.models import User
+
+        users = [f"player{i}" for i in range(args.users)]
+        with database.SessionLocal() as db:
+            db.add_all([User(username=u, email=f"{u}@q.com", hashed_password=security.get_password_hash(f"pw-{u}")) for u in users])
+            db.commit()
+
+        async def bench():
+            results = {}
+            try:
+                for name, workers in (("inline", 0), (f"pool x{args.workers}", args.workers)):
+                    config.HASH_WORKERS = workers
+                    security.shutdown()
+                    results[name] = await run(app, users, args.clients, args.logins)
+            finally:
+                security.shutdown()
+                await database.async_engine.dispose()
+            return results
+
+        results = asyncio.run(bench())
+
+    print(f"{args.logins} logins, {args.clients} concurrent clients, bcrypt cost {args.rounds}\n")
+    print(f"{'hashing':<12}{'logins/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'loop stall ms':>15}")
+    for name, (elapsed, lat, stall) in results.items():
+        p95 = lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+        print(f"{name:<12}{len(lat) / elapsed:>10.1f}{statistics.median(lat) * 1000:>10.0f}{p95 * 1000:>10.0f}{stall * 1000:>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+QuantumAI self-play across all cores, streaming one NDJSON line per game.
+
+    python -m benchmarks.selfplay --games 5000 --out selfplay.ndjson
+    python -m benchmarks.selfplay --games 5000 --out selfplay.ndjson --resume
+    python -m benchmarks.selfplay --pairing hard:normal --games 200 --moves --out hn.ndjson
+
+No database and no app: each worker process plays whole games on QuantumState
+(or --backend array) with QuantumAI on both sides. Game i is seeded with
+--seed + i (the engine's seed and the RNG behind candidate order and capture
+measurements), and hard search is cut by --nodes rather than time by default,
+so any game can be replayed exactly from its line. --pairing cycles game by
+game through the listed white:black difficulties (default: all nine).
+
+Lines are written as games finish, so the order is not the game order; with
+--resume the games already in --out are skipped and the rest appended. Memory
+stays flat however many games are asked for: at most two games per worker are
+queued, and the summary keeps per-pairing totals only.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+DIFFICULTIES = ('easy', 'normal', 'hard')
+
+# --- WORKER PROCESS SIDE ---
+_worker_tt = None
+
+def play_game(game, seed, white, black, options):
+    """Plays one game to a king falling, a side with no playable move, or options['max_plies']. Returns its NDJSON record."""
+    global _worker_tt
+    from app.modules.tournament.ai import QuantumAI
+    from app.modules.tournament.cache import ENGINE_BACKENDS
+    from app.modules.tournament.transposition import TranspositionTable
+
+    if _worker_tt is None:
+        _worker_tt = TranspositionTable(options['tt_size'])
+    _worker_tt.clear()  # Same seed, same game: nothing carried over from the worker's previous game
+    random.seed(seed)
+
+    start = time.perf_counter()
+    engine = ENGINE_BACKENDS[options['backend']](seed=seed)
+    bot = QuantumAI(time_budget=options['time_budget'], node_budget=options['nodes'], max_depth=options['depth'], tt=_worker_tt)
+    difficulty = {'white': white, 'black': black}
+    color, winner, end = 'white', None, 'max_plies'
+    think, moves, nodes = [], [], 0
+
+    for _ in range(options['max_plies']):
+        status = engine.check_game_over()
+        if status['game_over']:
+            winner, end = status['winner'], 'king'
+            break
+        move_start = time.perf_counter()
+        candidates = bot.calculate_move(engine, color, difficulty[color])
+        played = next((cand for cand in candidates if engine.apply_move(cand)), None)
+        think.append(round(time.perf_counter() - move_start, 6))
+        nodes += bot.last_stats.get('nodes', 0)
+        if played is None:
+            end = 'no_move'
+            break
+        moves.append(played)
+        color = 'black' if color == 'white' else 'white'
+    else:
+        status = engine.check_game_over()
+        if status['game_over']: winner, end = status['winner'], 'king'
+
+    record = {
+        'game': game, 'seed': seed, 'white': white, 'black': black, 'backend': options['backend'],
+        'winner': winner, 'end': end, 'plies': len(moves), 'nodes': nodes,
+        'elapsed': round(time.perf_counter() - start, 6), 'think': think,
+    }
+    if options['moves']: record['moves'] = moves
+    return record
+
+
+# --- DRIVER ---
+class Summary:
+    """Per-pairing totals: wins, draws, plies and think time (no per-game data, so it stays small)."""
+
+    def __init__(self):
+        self.games = defaultdict(lambda: {'white': 0, 'black': 0, 'none': 0, 'plies': 0})
+        self.think = defaultdict(lambda: [0, 0.0, 0.0])  # difficulty -> [moves, total seconds, worst]
+
+    def add(self, record):
+        pairing = self.games[(record['white'], record['black'])]
+        pairing[record['winner'] or 'none'] += 1
+        pairing['plies'] += record['plies']
+        for i, secs in enumerate(record['think']):
+            totals = self.think[record['white'] if i % 2 == 0 else record['black']]
+            totals[0] += 1
+            totals[1] += secs
+            totals[2] = max(totals[2], secs)
+
+    def report(self):
+        print(f"\n{'white:black':<16}{'games':>7}{'white':>8}{'black':>8}{'undecided':>11}{'avg plies':>11}")
+        for (white, black), g in sorted(self.games.items()):
+            n = g['white'] + g['black'] + g['none']
+            print(f"{white + ':' + black:<16}{n:>7}{g['white'] / n:>8.1%}{g['black'] / n:>8.1%}{g['none'] / n:>11.1%}{g['plies'] / n:>11.1f}")
+        print(f"\n{'difficulty':<16}{'moves':>9}{'avg ms':>9}{'max ms':>9}")
+        for difficulty, (n, total, worst) in sorted(self.think.items()):
+            print(f"{difficulty:<16}{n:>9}{total / n * 1000:>9.2f}{worst * 1000:>9.1f}")
+
+
+def load_done(path, base_seed, summary):
+    """Games already in `path` (counted into `summary`). A torn last line from an interrupted run is cut off."""
+    done = set()
+    if not os.path.exists(path): return done
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+            data = data[:data.rfind(b'\n') + 1]
+    for line in data.splitlines():
+        record = json.loads(line)
+        if record['seed'] != base_seed + record['game']:
+            sys.exit(f"{path} was written with another --seed (game {record['game']} has seed {record['seed']})")
+        done.add(record['game'])
+        summary.add(record)
+    return done
+
+
+def parse_pairing(value):
+    white, _, black = value.partition(':')
+    if white not in DIFFICULTIES or black not in DIFFICULTIES:
+        raise argparse.ArgumentTypeError(f"expected white:black with each one of {', '.join(DIFFICULTIES)}")
+    return white, black
+
+
+def main():
+    from app.core import config
+    from app.modules.tournament.cache import ENGINE_BACKENDS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--out', required=True, help="NDJSON results file")
+    parser.add_argument('--resume', action='store_true', help="skip the games already in --out and append the rest")
+    parser.add_argument('--pairing', type=parse_pairing, action='append', metavar='WHITE:BLACK',
+                        help="difficulties to play, cycled game by game (repeatable; default: every combination)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=1, help="game i is seeded with SEED + i")
+    parser.add_argument('--max-plies', type=int, default=300, help="undecided after this many plies")
+    parser.add_argument('--backend', choices=sorted(ENGINE_BACKENDS), default='dict')
+    parser.add_argument('--nodes', type=int, default=5000, help="hard search node budget per move (0 = unlimited)")
+    parser.add_argument('--time-budget', type=float, default=0, help="hard search seconds per move (0 = none; a time limit makes games depend on machine speed)")
+    parser.add_argument('--depth', type=int, default=config.AI_MAX_DEPTH)
+    parser.add_argument('--tt-size', type=int, default=config.AI_TT_SIZE)
+    parser.add_argument('--moves', action='store_true', help="also record each game's moves")
+    args = parser.parse_args()
+
+    pairings = args.pairing or list(itertools.product(DIFFICULTIES, repeat=2))
+    options = {'backend': args.backend, 'max_plies': args.max_plies, 'nodes': args.nodes, 'time_budget': args.time_budget,
+               'depth': args.depth, 'tt_size': args.tt_size, 'moves': args.moves}
+
+    summary = Summary()
+    if args.resume:
+        done = load_done(args.out, args.seed, summary)
+    elif os.path.exists(args.out):
+        sys.exit(f"{args.out} exists: pass --resume to continue it, or pick another --out")
+    else:
+        done = set()
+    todo = (g for g in range(args.games) if g not in done)
+    remaining = args.games - sum(1 for g in done if g < args.games)
+    print(f"{remaining} games to play on {args.workers} workers ({len(done)} already in {args.out})")
+
+    start = time.perf_counter()
+    played, next_report = 0, 100
+    with open(args.out, 'a') as out, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        pending = set()
+        while True:
+            # Keep each worker busy with one game and one queued, never the whole backlog
+            for game in itertools.islice(todo, 2 * args.workers - len(pending)):
+                white, black = pairings[game % len(pairings)]
+                pending.add(pool.submit(play_game, game, args.seed + game, white, black, options))
+            if not pending: break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + '\n')
+                out.flush()  # A killed run loses at most the games in flight
+                summary.add(record)
+                played += 1
+            if played >= next_report:
+                next_report += 100
+                print(f"{played}/{remaining} games, {played / (time.perf_counter() - start):.1f} games/s", flush=True)
+
+    elapsed = time.perf_counter() - start
+    print(f"{played} games in {elapsed:.1f} s ({played / elapsed if elapsed else 0:.1f} games/s)")
+    summary.report()
+
+
+if __name__ == '__main__':
+    main()
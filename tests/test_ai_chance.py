@@ -0,0 +1,46 @@
+"""A capture that misses leaves the board as it was, and the side to move tries its next move."""
+import pytest
+
+from app.modules.tournament.ai import INF, WIN_SCORE, QuantumAI
+from app.modules.tournament.array_engine import ArrayQuantumState
+from app.modules.tournament.engine import QuantumState
+from app.modules.tournament.transposition import TranspositionTable
+
+
+def test_retry_values_fall_through_to_the_next_plan():
+    values = QuantumAI._retry_values([(10.0, 0.5, 'a'), (20.0, 0.5, 'b'), (-5.0, 0.5, 'c')], fallback=0.0)
+    assert values['a'] == 5.0                       # Missing a: the sure move
+    assert values['b'] == 0.5 * 20.0 + 0.5 * 5.0    # Missing b: a, and then the sure move
+    assert values['c'] == 0.5 * -5.0 + 0.5 * 0.0    # Lands worse than the sure move: not part of the plan
+    assert QuantumAI._retry_values([(1.0, 0.25, 'a')], fallback=4.0)['a'] == 3.25
+
+
+def full_width(ai, engine, color, depth):
+    """Plain minimax of the same model, no pruning and no table."""
+    status = engine.check_game_over()
+    if status['game_over']: return WIN_SCORE + depth if status['winner'] == color else -WIN_SCORE - depth
+    if depth == 0: return ai.evaluate_state(engine, color)
+    sure, chances = [], []
+    for move in ai._ordered_moves(engine, color):
+        prob = ai._capture_probability(engine, move[2:], color)
+        undo = engine.apply_move(move, collapse=True)
+        if not undo: continue
+        score = -full_width(ai, engine, ai.other(color), depth - 1)
+        engine.undo_move(undo)
+        if prob is not None and prob < 1.0: chances.append((score, prob, move))
+        else: sure.append(score)
+    fallback = max(sure) if sure else ai.evaluate_state(engine, color)
+    return max([fallback, *ai._retry_values(chances, fallback).values()])
+
+
+@pytest.mark.parametrize("backend", [QuantumState, ArrayQuantumState], ids=lambda cls: cls.__name__)
+def test_search_matches_full_width(backend):
+    engine = backend(seed=4)
+    engine.load_game("g1f3^g1h3,e7e5,b1c3^b1a3,d7d5")  # White's knights can capture on e5/d5, black's pawns on the halves
+    ai = QuantumAI(node_budget=0, time_budget=0, tt=TranspositionTable(0))
+    ai.nodes, ai.deadline = 0, None
+    for color in ('white', 'black'):
+        expected = full_width(ai, engine, color, 2)
+        assert ai._negamax(engine, color, 2, -INF, INF) == pytest.approx(expected)
+        assert ai._negamax(engine, color, 2, expected + 1, expected + 20) <= expected + 1  # Fails low
+        assert ai._negamax(engine, color, 2, expected - 20, expected - 1) >= expected - 1  # Fails high
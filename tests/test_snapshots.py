@@ -0,0 +1,99 @@
+"""to_snapshot()/restore_snapshot() round trips, and replay resuming from a checkpoint."""
+import pytest
+
+from app.modules.tournament.array_engine import ArrayQuantumState
+from app.modules.tournament.cache import MatchStateCache
+from app.modules.tournament.engine import QuantumState
+
+BACKENDS = [QuantumState, ArrayQuantumState]
+
+POSITIONS = {
+    'start': [],
+    'capture': ["e2e4", "d7d5", "e4d5", "d8d5"],
+    'split': ["g1f3^g1h3"],                              # Two fragments, and an entanglement colour
+    'merge': ["g1f3^g1h3", "e7e5", "f3g5", "d7d6", "h3g5"],
+    'mixed': ["g1f3^g1h3", "b8c6^b8a6", "e2e4", "d7d5", "e4d5", "c6d4", "f3g5", "g8f6", "h3g5", "f6d5"],
+}
+
+
+def occupied(engine):
+    return {sq: pieces for sq, pieces in engine.board.items() if pieces}  # The dict backend keeps emptied squares as []
+
+
+def replayed(backend, moves, seed=7):
+    engine = backend(seed=seed)
+    engine.load_game(",".join(moves))
+    return engine
+
+
+@pytest.mark.parametrize("backend", BACKENDS, ids=lambda cls: cls.__name__)
+@pytest.mark.parametrize("name", POSITIONS)
+def test_restore_is_bit_identical(backend, name):
+    original = replayed(backend, POSITIONS[name])
+    snap = original.to_snapshot(ply=len(POSITIONS[name]))
+
+    restored = backend(seed=7)
+    assert restored.restore_snapshot(snap) == len(POSITIONS[name])
+    assert restored.to_snapshot(ply=len(POSITIONS[name])) == snap
+    assert restored.board == original.board  # Complex amplitudes compared exactly
+    assert restored.entanglements == original.entanglements
+    assert restored.zobrist == original.zobrist
+
+
+def test_snapshots_are_portable_between_backends():
+    moves = POSITIONS['mixed']
+    for source, target in ((QuantumState, ArrayQuantumState), (ArrayQuantumState, QuantumState)):
+        snap = replayed(source, moves).to_snapshot(len(moves))
+        restored = target(seed=7)
+        restored.restore_snapshot(snap)
+        assert occupied(restored) == occupied(replayed(target, moves))
+        assert restored.zobrist == replayed(target, moves).zobrist
+
+
+@pytest.mark.parametrize("backend", BACKENDS, ids=lambda cls: cls.__name__)
+@pytest.mark.parametrize("at", range(len(POSITIONS['mixed']) + 1))
+def test_replay_from_checkpoint_matches_full_replay(backend, at):
+    moves = POSITIONS['mixed']
+    checkpoint = replayed(backend, moves[:at]).to_snapshot(ply=at)
+    full = replayed(backend, moves)
+
+    resumed = backend(seed=7)
+    replayed_plies = resumed.load_moves(lambda after: moves[after:], len(moves), checkpoint)
+    assert replayed_plies == len(moves) - at
+    assert resumed.to_snapshot(len(moves)) == full.to_snapshot(len(moves))
+    assert resumed.entanglements == full.entanglements
+
+
+@pytest.mark.parametrize("backend", BACKENDS, ids=lambda cls: cls.__name__)
+def test_stale_checkpoint_is_ignored(backend):
+    moves = POSITIONS['mixed']
+    longer = replayed(backend, moves).to_snapshot(ply=len(moves))  # From a history longer than the one replayed
+    short = moves[:4]
+
+    resumed = backend(seed=7)
+    assert resumed.load_moves(lambda after: short[after:], len(short), longer) == len(short)
+    assert resumed.to_snapshot(len(short)) == replayed(backend, short).to_snapshot(len(short))
+    assert resumed.entanglements == replayed(backend, short).entanglements
+    assert resumed.zobrist == resumed.compute_zobrist()
+
+
+def test_rejects_unknown_format():
+    snap = bytearray(QuantumState(seed=1).to_snapshot())
+    snap[2] += 1  # Version byte
+    with pytest.raises(ValueError):
+        QuantumState(seed=1).restore_snapshot(bytes(snap))
+
+
+@pytest.mark.parametrize("backend", BACKENDS, ids=lambda cls: cls.__name__)
+def test_cache_replays_with_the_match_epsilon(backend):
+    moves = ["g1f3^g1h3", "e7e5", "f3g5^f3e5"]  # The second split leaves fragments at 0.25
+    cache = MatchStateCache(engine_cls=backend)
+    states = {}
+    for epsilon in (0.0, 0.3):
+        cache.clear()
+        engine = cache.get(7, len(moves), lambda after: moves[after:], fragment_epsilon=epsilon)
+        expected = backend(seed=7, fragment_epsilon=epsilon)
+        expected.load_game(",".join(moves))
+        assert engine.to_snapshot(len(moves)) == expected.to_snapshot(len(moves))
+        states[epsilon] = occupied(engine)
+    assert states[0.0] != states[0.3]